@@ -0,0 +1,201 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Compact per-frame record kept in the ring buffer
+FRAME_RECORD_DTYPE = np.dtype([
+    ('timestamp', 'f8'),           # POSIX seconds
+    ('faces', 'u2'),
+    ('eyes', 'u2'),
+    ('brightness', 'f4'),
+    ('emotion', 'u1'),             # Index into AnalysisHistory.emotion_labels
+    ('gaze', 'u1'),                # Index into AnalysisHistory.gaze_labels, 0 = no gaze analysis
+    ('looking_at_screen', '?'),
+])
+
+
+def frame_counters(analysis: Dict) -> Dict[str, float]:
+    """
+    What one frame analysis adds to the running counters of its session
+
+    Labelled counts are named 'emotion:<label>' and 'gaze:<label>'.
+    """
+    eye_analysis = analysis.get('eye_analysis') or {}
+    gaze_analysis = eye_analysis.get('gaze_analysis')
+    counters = {
+        'frames': 1,
+        'faces': analysis.get('faces_detected', 0),
+        'eyes': eye_analysis.get('eyes_detected', 0),
+        'brightness': analysis.get('brightness', 0),
+        f"emotion:{analysis.get('estimated_emotion', 'unknown')}": 1
+    }
+    if gaze_analysis:
+        counters[f"gaze:{gaze_analysis.get('gaze_direction', 'unknown')}"] = 1
+        if gaze_analysis.get('is_looking_at_screen', False):
+            counters['looking_at_screen'] = 1
+    if analysis.get('unchanged_frame'):
+        counters['unchanged'] = 1
+    return counters
+
+
+def summarize_counters(counters: Dict[str, float], first_timestamp: Optional[str],
+                       last_timestamp: Optional[str]) -> Dict:
+    """
+    Session summary from running counters as built by frame_counters
+    """
+    frames = int(counters.get('frames', 0))
+    if frames == 0:
+        return {'message': 'No analysis data available'}
+
+    def labelled(prefix: str) -> Dict[str, int]:
+        return {name[len(prefix):]: int(value) for name, value in counters.items()
+                if name.startswith(prefix)}
+
+    return {
+        'total_frames_analyzed': frames,
+        'total_faces_detected': int(counters.get('faces', 0)),
+        'total_eyes_detected': int(counters.get('eyes', 0)),
+        'emotion_distribution': labelled('emotion:'),
+        'gaze_direction_distribution': labelled('gaze:'),
+        'looking_at_screen_percentage': float(counters.get('looking_at_screen', 0) / frames * 100),
+        'average_brightness': float(counters.get('brightness', 0) / frames),
+        'analysis_period': {
+            'start': first_timestamp,
+            'end': last_timestamp
+        }
+    }
+
+
+class AnalysisHistory:
+    def __init__(self, capacity: int = 3600):
+        """
+        Fixed-capacity history of frame analyses with running aggregates
+
+        The newest `capacity` frames are kept as compact records; the
+        aggregates used by summary() cover every frame ever appended.
+
+        Args:
+            capacity: Number of frame records retained
+        """
+        self.capacity = capacity
+        self._records = np.zeros(capacity, dtype=FRAME_RECORD_DTYPE)
+        self._next = 0
+        self._size = 0
+
+        # Label tables for the coded record fields
+        self.emotion_labels: List[str] = []
+        self.gaze_labels: List[Optional[str]] = [None]
+        self._emotion_codes: Dict[str, int] = {}
+        self._gaze_codes: Dict[str, int] = {}
+
+        # Running aggregates
+        self.total_frames = 0
+        self.total_faces = 0
+        self.total_eyes = 0
+        self.looking_at_screen_count = 0
+        self.brightness_sum = 0.0
+        self.emotion_counts: Dict[str, int] = {}
+        self.gaze_counts: Dict[str, int] = {}
+        self.first_timestamp: Optional[str] = None
+        self.last_timestamp: Optional[str] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _code(self, label: str, codes: Dict[str, int], labels: List) -> int:
+        code = codes.get(label)
+        if code is None:
+            code = len(labels)
+            if code > 255:
+                raise ValueError(f"Too many distinct labels in history (adding '{label}')")
+            codes[label] = code
+            labels.append(label)
+        return code
+
+    def append(self, analysis: Dict):
+        """
+        Record a frame analysis and update the running aggregates
+        """
+        timestamp = analysis.get('timestamp') or datetime.now().isoformat()
+        faces = analysis.get('faces_detected', 0)
+        eye_analysis = analysis.get('eye_analysis') or {}
+        eyes = eye_analysis.get('eyes_detected', 0)
+        brightness = analysis.get('brightness', 0)
+        emotion = analysis.get('estimated_emotion', 'unknown')
+        gaze_analysis = eye_analysis.get('gaze_analysis')
+
+        record = self._records[self._next]
+        record['timestamp'] = datetime.fromisoformat(timestamp).timestamp()
+        record['faces'] = faces
+        record['eyes'] = eyes
+        record['brightness'] = brightness
+        record['emotion'] = self._code(emotion, self._emotion_codes, self.emotion_labels)
+        record['gaze'] = 0
+        record['looking_at_screen'] = False
+
+        if gaze_analysis:
+            gaze_dir = gaze_analysis.get('gaze_direction', 'unknown')
+            record['gaze'] = self._code(gaze_dir, self._gaze_codes, self.gaze_labels)
+            self.gaze_counts[gaze_dir] = self.gaze_counts.get(gaze_dir, 0) + 1
+            if gaze_analysis.get('is_looking_at_screen', False):
+                record['looking_at_screen'] = True
+                self.looking_at_screen_count += 1
+
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+        self.total_frames += 1
+        self.total_faces += faces
+        self.total_eyes += eyes
+        self.brightness_sum += brightness
+        self.emotion_counts[emotion] = self.emotion_counts.get(emotion, 0) + 1
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        self.last_timestamp = timestamp
+
+    def records(self) -> np.ndarray:
+        """
+        Retained frame records, oldest first
+        """
+        if self._size < self.capacity:
+            return self._records[:self._size].copy()
+        return np.concatenate((self._records[self._next:], self._records[:self._next]))
+
+    def to_dicts(self) -> List[Dict]:
+        """
+        Retained frame records as JSON-ready dicts, oldest first
+        """
+        return [
+            {
+                'timestamp': datetime.fromtimestamp(float(record['timestamp'])).isoformat(),
+                'faces_detected': int(record['faces']),
+                'eyes_detected': int(record['eyes']),
+                'brightness': float(record['brightness']),
+                'estimated_emotion': self.emotion_labels[record['emotion']],
+                'gaze_direction': self.gaze_labels[record['gaze']],
+                'is_looking_at_screen': bool(record['looking_at_screen'])
+            }
+            for record in self.records()
+        ]
+
+    def summary(self) -> Dict:
+        """
+        Summary of all recorded frames, computed from the running aggregates
+        """
+        return summarize_counters(self.counters(), self.first_timestamp, self.last_timestamp)
+
+    def counters(self) -> Dict[str, float]:
+        """
+        The running aggregates in the form of frame_counters
+        """
+        counters = {
+            'frames': self.total_frames,
+            'faces': self.total_faces,
+            'eyes': self.total_eyes,
+            'brightness': self.brightness_sum,
+            'looking_at_screen': self.looking_at_screen_count
+        }
+        counters.update((f"emotion:{label}", count) for label, count in self.emotion_counts.items())
+        counters.update((f"gaze:{label}", count) for label, count in self.gaze_counts.items())
+        return counters
@@ -0,0 +1,374 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Default database of the analysis store
+ANALYSIS_DB_PATH = os.path.join("video_analysis_output", "analysis.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    faces INTEGER NOT NULL,
+    eyes INTEGER NOT NULL,
+    brightness REAL,
+    emotion TEXT,
+    gaze_direction TEXT,
+    looking_at_screen INTEGER NOT NULL,
+    gaze_state TEXT,
+    unchanged INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS frames_session_time ON frames (session_id, timestamp);
+CREATE INDEX IF NOT EXISTS frames_time ON frames (timestamp);
+CREATE INDEX IF NOT EXISTS frames_gaze_time ON frames (gaze_direction, timestamp);
+CREATE INDEX IF NOT EXISTS frames_emotion_time ON frames (emotion, timestamp);
+
+CREATE TABLE IF NOT EXISTS session_stats (
+    session_id TEXT PRIMARY KEY,
+    frames INTEGER NOT NULL,
+    face_frames INTEGER NOT NULL,
+    looking_frames INTEGER NOT NULL,
+    brightness_sum REAL NOT NULL,
+    first_timestamp REAL NOT NULL,
+    last_timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS session_stats_last ON session_stats (last_timestamp);
+
+CREATE TABLE IF NOT EXISTS session_labels (
+    session_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    label TEXT NOT NULL,
+    frames INTEGER NOT NULL,
+    PRIMARY KEY (session_id, field, label)
+);
+"""
+
+_INSERT_FRAME = """
+INSERT INTO frames (session_id, timestamp, faces, eyes, brightness, emotion, gaze_direction,
+                    looking_at_screen, gaze_state, unchanged)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_UPSERT_STATS = """
+INSERT INTO session_stats (session_id, frames, face_frames, looking_frames, brightness_sum,
+                           first_timestamp, last_timestamp)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (session_id) DO UPDATE SET
+    frames = frames + excluded.frames,
+    face_frames = face_frames + excluded.face_frames,
+    looking_frames = looking_frames + excluded.looking_frames,
+    brightness_sum = brightness_sum + excluded.brightness_sum,
+    first_timestamp = MIN(first_timestamp, excluded.first_timestamp),
+    last_timestamp = MAX(last_timestamp, excluded.last_timestamp)
+"""
+
+_UPSERT_LABEL = """
+INSERT INTO session_labels (session_id, field, label, frames) VALUES (?, ?, ?, ?)
+ON CONFLICT (session_id, field, label) DO UPDATE SET frames = frames + excluded.frames
+"""
+
+
+def frame_row(session_id: str, analysis: Dict) -> tuple:
+    """
+    Row of the frames table for one frame analysis
+    """
+    eye_analysis = analysis.get('eye_analysis') or {}
+    gaze_analysis = eye_analysis.get('gaze_analysis') or {}
+    gaze_state = analysis.get('gaze_state') or {}
+    return (
+        session_id,
+        datetime.fromisoformat(analysis['timestamp']).timestamp(),
+        analysis.get('faces_detected', 0),
+        eye_analysis.get('eyes_detected', 0),
+        analysis.get('brightness'),
+        analysis.get('estimated_emotion'),
+        gaze_analysis.get('gaze_direction'),
+        int(bool(gaze_analysis.get('is_looking_at_screen', False))),
+        gaze_state.get('state'),
+        int(bool(analysis.get('unchanged_frame')))
+    )
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else None
+
+
+class AnalysisStore:
+    def __init__(self, path: str = ANALYSIS_DB_PATH, max_queue: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 1.0, timeout: float = 10.0):
+        """
+        Persistent, indexed store of per-frame analyses in SQLite
+
+        Frames are inserted on a background thread in batches of up to
+        batch_size rows, one transaction per batch, so the analysis path
+        only queues a row. Per-session totals and emotion / gaze counts are
+        rolled up in the same transaction, so session level queries do not
+        scan frames. Rows become visible within flush_interval seconds.
+        Several API workers may share one database file.
+
+        Args:
+            path: Database file, created if missing
+            max_queue: Rows waiting to be written before new ones are dropped
+            batch_size: Most rows written per transaction
+            flush_interval: Seconds the first queued row waits for others to join its batch
+            timeout: Seconds to wait for another process's write lock
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches = 0
+        self.write_errors = 0
+
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="analysis-store", daemon=True)
+        self._thread.start()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections may only be used by the thread that opened them
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def submit(self, session_id: str, analysis: Dict) -> bool:
+        """
+        Queue a recorded frame analysis for insertion, returns False if it was dropped
+        """
+        try:
+            self._queue.put_nowait(frame_row(session_id, analysis))
+            return True
+        except queue.Full:
+            self.rows_dropped += 1
+            return False
+
+    def _collect(self, first: tuple) -> List[Optional[tuple]]:
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                row = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(row)
+            if row is None:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            row = self._queue.get()
+            batch = [row] if row is None else self._collect(row)
+            rows = [row for row in batch if row is not None]
+            if rows:
+                try:
+                    self._write(rows)
+                    self.rows_written += len(rows)
+                    self.batches += 1
+                except Exception as e:
+                    print(f"Error writing analysis batch: {e}")
+                    self.write_errors += 1
+            if len(rows) < len(batch):
+                return
+
+    def _write(self, rows: List[tuple]):
+        # Roll the batch up per session first, so each session costs one upsert
+        stats = {}
+        labels = defaultdict(int)
+        for (session_id, timestamp, faces, _, brightness, emotion, gaze_direction,
+             looking, _, _) in rows:
+            totals = stats.get(session_id)
+            if totals is None:
+                totals = stats[session_id] = [0, 0, 0, 0.0, timestamp, timestamp]
+            totals[0] += 1
+            totals[1] += faces > 0
+            totals[2] += looking
+            totals[3] += brightness or 0.0
+            totals[4] = min(totals[4], timestamp)
+            totals[5] = max(totals[5], timestamp)
+            if emotion is not None:
+                labels[session_id, 'emotion', emotion] += 1
+            if gaze_direction is not None:
+                labels[session_id, 'gaze_direction', gaze_direction] += 1
+
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(_INSERT_FRAME, rows)
+            connection.executemany(_UPSERT_STATS, [(session_id, *totals) for session_id, totals in stats.items()])
+            connection.executemany(_UPSERT_LABEL, [(*key, frames) for key, frames in labels.items()])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def query_frames(self, session_id: Optional[str] = None, start: Optional[float] = None,
+                     end: Optional[float] = None, gaze_direction: Optional[str] = None,
+                     emotion: Optional[str] = None, limit: int = 1000) -> List[Dict]:
+        """
+        Stored frames matching all given filters, oldest first
+
+        Args:
+            session_id: Only frames of this session
+            start: Only frames at or after this POSIX time
+            end: Only frames before this POSIX time
+            gaze_direction: Only frames with this gaze direction
+            emotion: Only frames with this estimated emotion
+            limit: Most frames returned
+        """
+        where, params = self._time_filter(start, end)
+        for column, value in (('session_id', session_id), ('gaze_direction', gaze_direction),
+                              ('emotion', emotion)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        sql = "SELECT * FROM frames"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY timestamp LIMIT ?"
+        params.append(limit)
+
+        frames = []
+        for row in self._connection().execute(sql, params):
+            frame = dict(row)
+            del frame['id']
+            frame['timestamp'] = _isoformat(frame['timestamp'])
+            frame['looking_at_screen'] = bool(frame['looking_at_screen'])
+            frame['unchanged'] = bool(frame['unchanged'])
+            frames.append(frame)
+        return frames
+
+    def aggregate(self, session_id: Optional[str] = None, start: Optional[float] = None,
+                  end: Optional[float] = None, bucket_seconds: Optional[float] = None) -> List[Dict]:
+        """
+        Frame counts, looking-at-screen percentage and brightness per time bucket
+
+        Without bucket_seconds a single bucket covers the whole range.
+        """
+        where, params = self._time_filter(start, end)
+        if session_id is not None:
+            where.append("session_id = ?")
+            params.append(session_id)
+        bucket = "CAST(timestamp / ? AS INTEGER) * ?" if bucket_seconds else "NULL"
+        bucket_params = [bucket_seconds, bucket_seconds] if bucket_seconds else []
+        sql = (f"SELECT {bucket} AS bucket, COUNT(*) AS frames, SUM(faces > 0) AS face_frames,"
+               " SUM(looking_at_screen) AS looking_frames, AVG(brightness) AS average_brightness,"
+               " MIN(timestamp) AS first, MAX(timestamp) AS last FROM frames")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY bucket ORDER BY bucket"
+
+        buckets = []
+        for row in self._connection().execute(sql, bucket_params + params):
+            if not row['frames']:
+                continue
+            buckets.append({
+                'bucket_start': _isoformat(row['bucket']),
+                'frames': row['frames'],
+                'face_frames': row['face_frames'],
+                'looking_at_screen_percentage': 100.0 * row['looking_frames'] / row['frames'],
+                'average_brightness': row['average_brightness'],
+                'first_frame': _isoformat(row['first']),
+                'last_frame': _isoformat(row['last'])
+            })
+        return buckets
+
+    def query_sessions(self, min_looking_away_percentage: Optional[float] = None,
+                       start: Optional[float] = None, end: Optional[float] = None,
+                       limit: int = 100) -> List[Dict]:
+        """
+        Per-session totals from the rollup tables, most recent session first
+
+        Args:
+            min_looking_away_percentage: Only sessions not looking at the screen for at least this share of frames
+            start: Only sessions with frames at or after this POSIX time
+            end: Only sessions with frames before this POSIX time
+            limit: Most sessions returned
+        """
+        where, params = [], []
+        if start is not None:
+            where.append("last_timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("first_timestamp < ?")
+            params.append(end)
+        if min_looking_away_percentage is not None:
+            where.append("100.0 * (frames - looking_frames) / frames >= ?")
+            params.append(min_looking_away_percentage)
+        sql = "SELECT * FROM session_stats"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY last_timestamp DESC LIMIT ?"
+        params.append(limit)
+
+        connection = self._connection()
+        sessions = []
+        for row in connection.execute(sql, params).fetchall():
+            distributions = {'emotion': {}, 'gaze_direction': {}}
+            for label in connection.execute(
+                    "SELECT field, label, frames FROM session_labels WHERE session_id = ?",
+                    (row['session_id'],)):
+                distributions[label['field']][label['label']] = label['frames']
+            sessions.append({
+                'session_id': row['session_id'],
+                'frames': row['frames'],
+                'face_frames': row['face_frames'],
+                'looking_at_screen_percentage': 100.0 * row['looking_frames'] / row['frames'],
+                'looking_away_percentage': 100.0 * (row['frames'] - row['looking_frames']) / row['frames'],
+                'average_brightness': row['brightness_sum'] / row['frames'],
+                'emotion_distribution': distributions['emotion'],
+                'gaze_direction_distribution': distributions['gaze_direction'],
+                'first_frame': _isoformat(row['first_timestamp']),
+                'last_frame': _isoformat(row['last_timestamp'])
+            })
+        return sessions
+
+    @staticmethod
+    def _time_filter(start: Optional[float], end: Optional[float]) -> tuple:
+        where, params = [], []
+        if start is not None:
+            where.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("timestamp < ?")
+            params.append(end)
+        return where, params
+
+    def status(self) -> Dict:
+        return {
+            'rows_written': self.rows_written,
+            'rows_dropped': self.rows_dropped,
+            'rows_queued': self._queue.qsize(),
+            'batches': self.batches,
+            'write_errors': self.write_errors
+        }
+
+    def close(self, timeout: float = 5.0):
+        """
+        Write the rows still queued and stop the writer thread
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
@@ -0,0 +1,118 @@
+"""
+Benchmark face/eye detection latency and accuracy per detection resolution
+
+Runs SimpleVideoProcessor over a folder of images at several detection
+widths and compares the boxes found with native-resolution detection.
+
+Usage:
+    python benchmarks/detection_resolution.py images/ --widths 0 960 640 480 320
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simple_video_processor import FrameContext, SimpleVideoProcessor
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def load_images(image_dir: str) -> List[np.ndarray]:
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            image = cv2.imread(os.path.join(image_dir, name), cv2.IMREAD_COLOR)
+            if image is not None:
+                images.append(image)
+    return images
+
+
+def box_iou(a: Dict, b: Dict) -> float:
+    x0 = max(a['x'], b['x'])
+    y0 = max(a['y'], b['y'])
+    x1 = min(a['x'] + a['width'], b['x'] + b['width'])
+    y1 = min(a['y'] + a['height'], b['y'] + b['height'])
+    inter = max(x1 - x0, 0) * max(y1 - y0, 0)
+    union = a['width'] * a['height'] + b['width'] * b['height'] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_faces(reference: List[Dict], faces: List[Dict], threshold: float = 0.5):
+    """
+    Count reference faces matched by a detection with IoU >= threshold
+    """
+    matched = 0
+    ious = []
+    for ref in reference:
+        best = max((box_iou(ref, face) for face in faces), default=0.0)
+        if best >= threshold:
+            matched += 1
+            ious.append(best)
+    return matched, ious
+
+
+def run_width(images: List[np.ndarray], width: int, eye_roi_width: int, repeats: int):
+    processor = SimpleVideoProcessor(track_faces=False, detection_width=width or None,
+                                     eye_roi_width=eye_roi_width or None)
+    timings = []
+    detections = []
+    for image in images:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            ctx = FrameContext(image)
+            faces = processor.detect_faces(ctx)
+            eyes = []
+            if faces:
+                primary_face = max(faces, key=lambda f: f['width'] * f['height'])
+                eyes = processor.detect_eyes_improved(ctx, primary_face)
+            timings.append((time.perf_counter() - start) * 1000)
+        detections.append((faces, len(eyes)))
+    return np.array(timings), detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('image_dir', help='Folder with test images')
+    parser.add_argument('--widths', type=int, nargs='+', default=[0, 960, 640, 480, 320],
+                        help='Detection widths to compare (0 = native resolution)')
+    parser.add_argument('--eye-roi-width', type=int, default=0,
+                        help='Normalised face width for eye detection (0 = native)')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per image')
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir)
+    if not images:
+        sys.exit(f"No images found in {args.image_dir}")
+
+    print(f"{len(images)} images, {args.repeats} runs each, eye ROI width {args.eye_roi_width or 'native'}")
+    _, reference = run_width(images, 0, 0, 1)
+    reference_faces = sum(len(faces) for faces, _ in reference)
+
+    print(f"{'width':>7} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'face recall':>12} {'mean IoU':>9} {'eye count ok':>13}")
+    for width in args.widths:
+        timings, detections = run_width(images, width, args.eye_roi_width, args.repeats)
+
+        matched = 0
+        ious = []
+        eyes_agree = 0
+        for (ref_faces, ref_eyes), (faces, eyes) in zip(reference, detections):
+            image_matched, image_ious = match_faces(ref_faces, faces)
+            matched += image_matched
+            ious.extend(image_ious)
+            eyes_agree += int(ref_eyes == eyes)
+
+        recall = matched / reference_faces if reference_faces else float('nan')
+        mean_iou = float(np.mean(ious)) if ious else float('nan')
+        print(f"{width or 'native':>7} {timings.mean():9.1f} {np.percentile(timings, 50):8.1f} "
+              f"{np.percentile(timings, 95):8.1f} {recall:12.2f} {mean_iou:9.2f} "
+              f"{eyes_agree / len(images):13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark face detector backends for latency, throughput and agreement
+
+Runs every backend over a folder of images and compares the faces found
+with those of a reference backend (the first one by default). Backends
+whose dependency or model files are missing are skipped.
+
+Usage:
+    python benchmarks/detector_backends.py images/ --backends haar mediapipe dnn
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detection_resolution import load_images, match_faces
+from face_detectors import FACE_DETECTOR_BACKENDS, FaceDetector, create_face_detector
+from frame_context import FrameContext
+
+
+def run_backend(detector: FaceDetector, images: List[np.ndarray], repeats: int):
+    """
+    Time detector over the images; returns per-frame ms, CPU seconds and the faces per image
+    """
+    timings = []
+    detections = []
+    cpu_start = time.process_time()
+    for image in images:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            faces = detector.detect(FrameContext(image))
+            timings.append((time.perf_counter() - start) * 1000)
+        detections.append(faces)
+    return np.array(timings), time.process_time() - cpu_start, detections
+
+
+def agreement(reference: List[List[Dict]], detections: List[List[Dict]]) -> Dict:
+    """
+    Recall and precision of detections against the reference faces, and mean IoU of matches
+    """
+    reference_faces = sum(len(faces) for faces in reference)
+    detected_faces = sum(len(faces) for faces in detections)
+    recalled = 0
+    precise = 0
+    ious = []
+    for ref_faces, faces in zip(reference, detections):
+        matched, image_ious = match_faces(ref_faces, faces)
+        recalled += matched
+        ious.extend(image_ious)
+        precise += match_faces(faces, ref_faces)[0]
+    return {
+        'recall': recalled / reference_faces if reference_faces else float('nan'),
+        'precision': precise / detected_faces if detected_faces else float('nan'),
+        'mean_iou': float(np.mean(ious)) if ious else float('nan')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('image_dir', help='Folder with test images')
+    parser.add_argument('--backends', nargs='+', default=list(FACE_DETECTOR_BACKENDS),
+                        choices=FACE_DETECTOR_BACKENDS, help='Backends to compare')
+    parser.add_argument('--reference', default=None,
+                        help='Backend the others are compared with (default: first backend)')
+    parser.add_argument('--detection-width', type=int, default=0,
+                        help='Downscale frames wider than this before detection (0 = native)')
+    parser.add_argument('--dnn-model', default=None, help='res10 SSD .caffemodel for the dnn backend')
+    parser.add_argument('--dnn-config', default=None, help='deploy.prototxt for the dnn backend')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per image')
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir)
+    if not images:
+        sys.exit(f"No images found in {args.image_dir}")
+
+    options = {'dnn': {'model_path': args.dnn_model, 'config_path': args.dnn_config}}
+    results = {}
+    for backend in args.backends:
+        try:
+            detector = create_face_detector(backend, detection_width=args.detection_width or None,
+                                            **options.get(backend, {}))
+        except Exception as e:
+            print(f"Skipping {backend}: {e}")
+            continue
+        results[backend] = run_backend(detector, images, args.repeats)
+        detector.close()
+
+    if not results:
+        sys.exit("No backend could be loaded")
+
+    reference_backend = args.reference or next(iter(results))
+    if reference_backend not in results:
+        sys.exit(f"Reference backend {reference_backend} was not run")
+    reference = results[reference_backend][2]
+
+    frames = len(images) * args.repeats
+    print(f"{len(images)} images, {args.repeats} runs each, agreement against {reference_backend}")
+    print(f"{'backend':>10} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'fps/core':>9} {'faces':>6} {'recall':>7} {'precision':>10} {'mean IoU':>9}")
+    for backend, (timings, cpu_seconds, detections) in results.items():
+        agree = agreement(reference, detections)
+        fps_per_core = frames / cpu_seconds if cpu_seconds > 0 else float('nan')
+        print(f"{backend:>10} {timings.mean():9.1f} {np.percentile(timings, 50):8.1f} "
+              f"{np.percentile(timings, 95):8.1f} {np.percentile(timings, 99):8.1f} "
+              f"{fps_per_core:9.1f} {sum(len(faces) for faces in detections):6d} "
+              f"{agree['recall']:7.2f} {agree['precision']:10.2f} {agree['mean_iou']:9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import time
+
+import cv2
+import numpy as np
+
+
+def frame_thumbnail(frame: np.ndarray, width: int = 64) -> np.ndarray:
+    """
+    Small grayscale copy of a BGR frame for cheap frame comparison
+
+    The frame is subsampled with a stride before area averaging, so the cost
+    hardly depends on the frame resolution.
+    """
+    frame_h, frame_w = frame.shape[:2]
+    height = max(1, round(frame_h * width / frame_w))
+    step = max(1, frame_w // (width * 2))
+    small = cv2.resize(frame[::step, ::step], (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+
+class FrameChangeGate:
+    def __init__(self, pixel_threshold: int = 16, max_changed_fraction: float = 0.01,
+                 max_age: float = 1.0, thumbnail_width: int = 64):
+        """
+        Detects frames that look the same as the last analyzed frame
+
+        Frames are compared as small grayscale thumbnails. A frame counts as
+        unchanged when at most max_changed_fraction of the thumbnail pixels
+        differ by more than pixel_threshold gray levels, which ignores sensor
+        noise and JPEG artefacts but not a moving head. The reference is only
+        replaced by frames that are analyzed, so slow drift still adds up,
+        and it expires after max_age seconds so results are refreshed.
+
+        Args:
+            pixel_threshold: Gray level difference at which a thumbnail pixel counts as changed
+            max_changed_fraction: Fraction of changed pixels up to which a frame is unchanged
+            max_age: Seconds after which the next frame is analyzed regardless
+            thumbnail_width: Width of the compared thumbnails
+        """
+        self.pixel_threshold = pixel_threshold
+        self.max_changed_fraction = max_changed_fraction
+        self.max_age = max_age
+        self.thumbnail_width = thumbnail_width
+
+        self._reference = None
+        self._reference_time = 0.0
+
+    def is_unchanged(self, frame: np.ndarray) -> bool:
+        """
+        Whether frame can reuse the last analysis; otherwise it becomes the new reference
+        """
+        thumbnail = frame_thumbnail(frame, self.thumbnail_width)
+        now = time.monotonic()
+        if (self._reference is not None and self._reference.shape == thumbnail.shape
+                and now - self._reference_time < self.max_age):
+            changed = cv2.absdiff(thumbnail, self._reference) > self.pixel_threshold
+            if np.count_nonzero(changed) <= self.max_changed_fraction * changed.size:
+                return True
+
+        self._reference = thumbnail
+        self._reference_time = now
+        return False
+
+    def reset(self):
+        """
+        Forget the reference frame, so the next frame is analyzed
+        """
+        self._reference = None
@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from emotion_stage import deepface_emotions
+
+# Shared batcher of this process, see get_emotion_batcher
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+class EmotionBatcher:
+    def __init__(self, predict_batch: Optional[Callable[[List[np.ndarray]], List[Dict[str, float]]]] = None,
+                 max_batch: int = 16, max_wait: float = 0.005):
+        """
+        Micro-batching scheduler for emotion inference
+
+        Face crops submitted from any thread are collected for up to max_wait
+        seconds (or until max_batch crops are waiting) and classified in one
+        batch on a background thread; each caller gets its own result.
+
+        Args:
+            predict_batch: Classifies a list of BGR face crops, defaults to DeepFace
+            max_batch: Most crops per forward pass
+            max_wait: Seconds the first crop of a batch waits for more to arrive
+        """
+        self.predict_batch = predict_batch or deepface_emotions
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self.batches = 0
+        self.faces_classified = 0
+        self.errors = 0
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="emotion-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, face_image: np.ndarray) -> Future:
+        """
+        Queue a face crop for classification
+        """
+        future = Future()
+        self._queue.put((face_image, future))
+        return future
+
+    def classify(self, face_image: np.ndarray) -> Dict[str, float]:
+        """
+        Emotion scores of a face crop, waiting for the batch it ends up in
+
+        Has the same signature as emotion_stage.deepface_emotion, so it can
+        be used as an EmotionStage classifier.
+        """
+        return self.submit(face_image).result()
+
+    def _collect(self, first: tuple) -> List[tuple]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = self._collect(item)
+
+            faces = [face for face, _ in batch]
+            try:
+                results = self.predict_batch(faces)
+                if len(results) != len(batch):
+                    raise ValueError(f"Emotion model returned {len(results)} results for {len(batch)} faces")
+            except Exception as e:
+                print(f"Error classifying emotion batch: {e}")
+                self.errors += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.faces_classified += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def status(self) -> Dict:
+        return {
+            'batches': self.batches,
+            'faces_classified': self.faces_classified,
+            'mean_batch_size': round(self.faces_classified / self.batches, 2) if self.batches else 0.0,
+            'queued_faces': self._queue.qsize(),
+            'errors': self.errors
+        }
+
+    def close(self, timeout: float = 5.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+def get_emotion_batcher(max_batch: int = 16, max_wait: float = 0.005) -> EmotionBatcher:
+    """
+    The batcher shared by all processors of this process, created on first use
+
+    Sharing one batcher is what lets crops from different sessions end up in
+    the same batch. The arguments only apply when the batcher is created.
+    """
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = EmotionBatcher(max_batch=max_batch, max_wait=max_wait)
+        return _batcher
+
+
+def emotion_batcher_status() -> Optional[Dict]:
+    """
+    Status of the shared batcher, or None if it was never used
+    """
+    return _batcher.status() if _batcher is not None else None
@@ -0,0 +1,177 @@
+import importlib
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+import cv2
+import numpy as np
+
+from frame_context import FrameContext, as_frame_context
+
+EMOTION_MODELS = ('heuristic', 'deepface')
+
+# Output order of DeepFace's emotion model
+EMOTION_LABELS = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral')
+
+# DeepFace's emotion model, loaded on first use, see deepface_emotions
+_emotion_model = None
+_emotion_model_lock = threading.Lock()
+
+
+def load_deepface_emotion_model():
+    """
+    Load the Keras model behind DeepFace's emotion action
+
+    deepface is imported here because loading it takes seconds.
+    """
+    DeepFace = importlib.import_module('deepface').DeepFace
+    try:
+        client = DeepFace.build_model(task='facial_attribute', model_name='Emotion')
+    except TypeError:
+        # deepface < 0.0.90 takes only the model name
+        client = DeepFace.build_model('Emotion')
+    return getattr(client, 'model', client)
+
+
+def preprocess_emotion_face(face_image: np.ndarray) -> np.ndarray:
+    """
+    BGR face crop to the 48x48 grayscale [0, 1] input of the emotion model
+
+    Like DeepFace.analyze without face detection, the crop is padded to a
+    square with black borders first, so faces keep their aspect ratio.
+    """
+    height, width = face_image.shape[:2]
+    size = max(height, width)
+    top, left = (size - height) // 2, (size - width) // 2
+    square = cv2.copyMakeBorder(face_image, top, size - height - top, left, size - width - left,
+                                cv2.BORDER_CONSTANT, value=0)
+    gray = cv2.cvtColor(square, cv2.COLOR_BGR2GRAY)
+    gray = cv2.resize(gray, (48, 48), interpolation=cv2.INTER_AREA)
+    return gray.astype(np.float32)[:, :, None] / 255.0
+
+
+def deepface_emotions(faces: List[np.ndarray]) -> List[Dict[str, float]]:
+    """
+    Emotion scores (percent) of BGR face crops in one forward pass of DeepFace's emotion model
+
+    Single crops and micro-batches go through this same preprocessing and
+    model, so a face gets the same scores whether batching is on or not.
+    """
+    global _emotion_model
+    with _emotion_model_lock:
+        if _emotion_model is None:
+            _emotion_model = load_deepface_emotion_model()
+    batch = np.stack([preprocess_emotion_face(face) for face in faces])
+    predictions = np.asarray(_emotion_model.predict(batch, verbose=0), dtype=np.float64)
+    predictions = 100.0 * predictions / predictions.sum(axis=1, keepdims=True)
+    return [dict(zip(EMOTION_LABELS, scores.tolist())) for scores in predictions]
+
+
+def deepface_emotion(face_image: np.ndarray) -> Dict[str, float]:
+    """
+    Emotion scores (percent) of a BGR face crop using DeepFace's emotion model
+
+    The crop is already a face, so no face detection is run.
+    """
+    return deepface_emotions([face_image])[0]
+
+
+def difference_hash(gray: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Perceptual difference hash of a grayscale image as a hash_size**2 bit integer
+
+    Small changes in lighting, noise or JPEG artefacts flip few bits, while
+    a different expression or head pose flips many.
+    """
+    resized = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = resized[:, 1:] > resized[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hash_distance(a: int, b: int) -> int:
+    """
+    Number of differing bits between two hashes
+    """
+    return bin(a ^ b).count('1')
+
+
+class EmotionStage:
+    def __init__(self, classifier: Callable[[np.ndarray], Dict[str, float]] = deepface_emotion,
+                 max_hash_distance: int = 6, max_age: float = 2.0, crop_margin: float = 0.1,
+                 hash_size: int = 8):
+        """
+        Emotion classification of the primary face, throttled by a perceptual hash
+
+        The classifier only runs on the cropped face, and only when the crop's
+        hash differs from the one last classified by more than
+        max_hash_distance bits or the cached result is older than max_age
+        seconds. Otherwise the cached result is returned.
+
+        Args:
+            classifier: Returns emotion scores for a BGR face crop
+            max_hash_distance: Hash bits that may change before the face is classified again
+            max_age: Seconds a cached result may be reused
+            crop_margin: Fraction of the face size added around the face crop
+            hash_size: Hash grid size (hash_size**2 bits)
+        """
+        self.classifier = classifier
+        self.max_hash_distance = max_hash_distance
+        self.max_age = max_age
+        self.crop_margin = crop_margin
+        self.hash_size = hash_size
+
+        self._hash = None
+        self._result = None
+        self._classified_at = 0.0
+
+    def face_crop(self, frame_shape: tuple, face: Dict) -> tuple:
+        """
+        (x0, y0, x1, y1) of the face box grown by crop_margin and clipped to the frame
+        """
+        frame_h, frame_w = frame_shape[:2]
+        margin_x = int(face['width'] * self.crop_margin)
+        margin_y = int(face['height'] * self.crop_margin)
+        return (max(face['x'] - margin_x, 0), max(face['y'] - margin_y, 0),
+                min(face['x'] + face['width'] + margin_x, frame_w),
+                min(face['y'] + face['height'] + margin_y, frame_h))
+
+    def analyze(self, frame: Union[np.ndarray, FrameContext], face: Dict) -> Optional[Dict]:
+        """
+        Emotion of a face, reusing the cached result while the face looks the same
+
+        Returns None if the face crop is empty or the classifier fails.
+        """
+        ctx = as_frame_context(frame)
+        x0, y0, x1, y1 = self.face_crop(ctx.shape, face)
+        if x1 <= x0 or y1 <= y0:
+            return None
+
+        face_hash = difference_hash(ctx.gray[y0:y1, x0:x1], self.hash_size)
+        now = time.monotonic()
+        if (self._result is not None and now - self._classified_at < self.max_age
+                and hash_distance(face_hash, self._hash) <= self.max_hash_distance):
+            return dict(self._result, cached=True)
+
+        try:
+            emotions = self.classifier(ctx.frame[y0:y1, x0:x1])
+        except Exception as e:
+            print(f"Error classifying emotion: {e}")
+            return None
+
+        emotions = {emotion: float(score) for emotion, score in emotions.items()}
+        dominant_emotion = max(emotions, key=emotions.get) if emotions else 'neutral'
+        self._result = {
+            'dominant_emotion': dominant_emotion,
+            'confidence': emotions.get(dominant_emotion, 0.0),
+            'emotions': emotions
+        }
+        self._hash = face_hash
+        self._classified_at = now
+        return dict(self._result, cached=False)
+
+    def reset(self):
+        """
+        Forget the cached result, e.g. when the tracked face is lost
+        """
+        self._hash = None
+        self._result = None
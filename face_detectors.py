@@ -0,0 +1,246 @@
+import importlib
+import os
+from typing import Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from frame_context import FrameContext, as_frame_context
+
+FACE_DETECTOR_BACKENDS = ('haar', 'mediapipe', 'dnn')
+
+# Default location of the OpenCV DNN (res10 SSD) face model files
+DNN_MODEL_PATH = os.path.join('models', 'res10_300x300_ssd_iter_140000.caffemodel')
+DNN_CONFIG_PATH = os.path.join('models', 'deploy.prototxt')
+
+
+def detect_at_scale(cascade, gray: np.ndarray, scale: float, *args, **kwargs) -> np.ndarray:
+    """
+    Run a cascade on a resized copy of a grayscale image
+
+    Cascade arguments apply to the resized image; the returned (x, y, w, h)
+    boxes are mapped back to the coordinates of the input image.
+    """
+    if scale == 1.0:
+        return np.asarray(cascade.detectMultiScale(gray, *args, **kwargs)).reshape(-1, 4)
+
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+    resized = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
+    boxes = np.asarray(cascade.detectMultiScale(resized, *args, **kwargs)).reshape(-1, 4)
+    return np.rint(boxes / scale).astype(np.int32)
+
+
+def face_box(x, y, width, height, confidence) -> Dict:
+    return {
+        'x': int(x),
+        'y': int(y),
+        'width': int(width),
+        'height': int(height),
+        'confidence': float(confidence)
+    }
+
+
+class FaceDetector:
+    """
+    Face detection backend
+
+    Backends return faces as dicts with x, y, width, height and confidence
+    in the pixel coordinates of the frame they were given.
+    """
+    name = ''
+
+    def __init__(self, detection_width: Optional[int] = None):
+        """
+        Args:
+            detection_width: Downscale frames wider than this before detection
+        """
+        self.detection_width = detection_width
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether the backend's model loaded
+        """
+        return True
+
+    def detection_scale(self, frame_width: int) -> float:
+        """
+        Scale applied to a frame before detection
+        """
+        if self.detection_width and frame_width > self.detection_width:
+            return self.detection_width / frame_width
+        return 1.0
+
+    def detect(self, frame: Union[np.ndarray, FrameContext]) -> List[Dict]:
+        raise NotImplementedError
+
+    def detect_in_region(self, frame: Union[np.ndarray, FrameContext], region: Tuple[int, int, int, int],
+                         min_size: Tuple[int, int] = (0, 0),
+                         max_size: Optional[Tuple[int, int]] = None) -> List[Dict]:
+        """
+        Detect faces inside region (x0, y0, x1, y1) with sizes between min_size and max_size
+
+        By default the region is cropped and passed to detect.
+        """
+        ctx = as_frame_context(frame)
+        x0, y0, x1, y1 = region
+        faces = []
+        for face in self.detect(ctx.frame[y0:y1, x0:x1]):
+            if face['width'] < min_size[0] or face['height'] < min_size[1]:
+                continue
+            if max_size and (face['width'] > max_size[0] or face['height'] > max_size[1]):
+                continue
+            face['x'] += x0
+            face['y'] += y0
+            faces.append(face)
+        return faces
+
+    def resized(self, image: np.ndarray) -> Tuple[np.ndarray, float]:
+        """
+        Image downscaled to detection_width and the scale used
+        """
+        scale = self.detection_scale(image.shape[1])
+        if scale == 1.0:
+            return image, scale
+        return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA), scale
+
+    def close(self):
+        pass
+
+
+class HaarFaceDetector(FaceDetector):
+    name = 'haar'
+
+    def __init__(self, detection_width: Optional[int] = None, scale_factor: float = 1.1,
+                 min_neighbors: int = 4):
+        super().__init__(detection_width)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    @property
+    def ready(self) -> bool:
+        return not self.cascade.empty()
+
+    def detect(self, frame: Union[np.ndarray, FrameContext]) -> List[Dict]:
+        gray = as_frame_context(frame).gray
+        scale = self.detection_scale(gray.shape[1])
+        faces = detect_at_scale(self.cascade, gray, scale, self.scale_factor, self.min_neighbors)
+        # Haar cascades give no score, so every face gets the same confidence
+        return [face_box(x, y, w, h, 0.8) for (x, y, w, h) in faces]
+
+    def detect_in_region(self, frame: Union[np.ndarray, FrameContext], region: Tuple[int, int, int, int],
+                         min_size: Tuple[int, int] = (0, 0),
+                         max_size: Optional[Tuple[int, int]] = None) -> List[Dict]:
+        """
+        Search the grayscale region directly, bounding the cascade's search scales
+        """
+        ctx = as_frame_context(frame)
+        x0, y0, x1, y1 = region
+        scale = self.detection_scale(ctx.shape[1])
+        kwargs = {'minSize': (int(min_size[0] * scale), int(min_size[1] * scale))}
+        if max_size:
+            kwargs['maxSize'] = (int(max_size[0] * scale), int(max_size[1] * scale))
+        faces = detect_at_scale(self.cascade, ctx.gray[y0:y1, x0:x1], scale,
+                                self.scale_factor, self.min_neighbors, **kwargs)
+        return [face_box(x0 + x, y0 + y, w, h, 0.8) for (x, y, w, h) in faces]
+
+
+class MediaPipeFaceDetector(FaceDetector):
+    name = 'mediapipe'
+
+    def __init__(self, detection_width: Optional[int] = None, model_selection: int = 0,
+                 min_confidence: float = 0.5):
+        super().__init__(detection_width)
+        mp = importlib.import_module('mediapipe')
+        self._detector = mp.solutions.face_detection.FaceDetection(
+            model_selection=model_selection, min_detection_confidence=min_confidence
+        )
+
+    def detect(self, frame: Union[np.ndarray, FrameContext]) -> List[Dict]:
+        image, _ = self.resized(as_frame_context(frame).frame)
+        results = self._detector.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+        # Boxes are relative, so they map straight back to the original frame;
+        # they can reach past the frame edge and are clipped to it
+        h, w = as_frame_context(frame).shape[:2]
+        faces = []
+        for detection in results.detections or []:
+            bbox = detection.location_data.relative_bounding_box
+            x0, y0 = max(bbox.xmin, 0.0) * w, max(bbox.ymin, 0.0) * h
+            x1 = min(bbox.xmin + bbox.width, 1.0) * w
+            y1 = min(bbox.ymin + bbox.height, 1.0) * h
+            if x1 > x0 and y1 > y0:
+                faces.append(face_box(x0, y0, x1 - x0, y1 - y0, detection.score[0]))
+        return faces
+
+    def close(self):
+        self._detector.close()
+
+
+class DnnFaceDetector(FaceDetector):
+    name = 'dnn'
+
+    def __init__(self, detection_width: Optional[int] = None, model_path: Optional[str] = None,
+                 config_path: Optional[str] = None, min_confidence: float = 0.5,
+                 input_size: int = 300):
+        """
+        OpenCV DNN face detector using the res10 SSD Caffe model
+
+        The network always sees an input_size square image, so detection_width
+        has no effect on this backend.
+
+        Args:
+            model_path: .caffemodel weights, defaults to DNN_MODEL_PATH
+            config_path: deploy.prototxt, defaults to DNN_CONFIG_PATH
+            min_confidence: Detections below this score are dropped
+            input_size: Network input width and height
+        """
+        super().__init__(detection_width)
+        model_path = model_path or DNN_MODEL_PATH
+        config_path = config_path or DNN_CONFIG_PATH
+        for path in (model_path, config_path):
+            if not os.path.exists(path):
+                raise IOError(f"DNN face model file not found: {path}")
+
+        self.min_confidence = min_confidence
+        self.input_size = input_size
+        self._net = cv2.dnn.readNetFromCaffe(config_path, model_path)
+
+    @property
+    def ready(self) -> bool:
+        return not self._net.empty()
+
+    def detect(self, frame: Union[np.ndarray, FrameContext]) -> List[Dict]:
+        image = as_frame_context(frame).frame
+        h, w = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, (self.input_size, self.input_size),
+                                     (104.0, 177.0, 123.0))
+        self._net.setInput(blob)
+        detections = self._net.forward().reshape(-1, 7)
+
+        detections = detections[detections[:, 2] >= self.min_confidence]
+        boxes = np.clip(detections[:, 3:7], 0.0, 1.0) * np.array([w, h, w, h])
+        return [face_box(x0, y0, x1 - x0, y1 - y0, score)
+                for (x0, y0, x1, y1), score in zip(boxes, detections[:, 2])
+                if x1 > x0 and y1 > y0]
+
+
+def create_face_detector(backend: str = 'haar', detection_width: Optional[int] = None,
+                         **options) -> FaceDetector:
+    """
+    Build a face detector by backend name
+
+    Args:
+        backend: One of FACE_DETECTOR_BACKENDS
+        detection_width: Downscale frames wider than this before detection
+        options: Backend specific arguments, e.g. model_path for 'dnn'
+    """
+    backends = {
+        'haar': HaarFaceDetector,
+        'mediapipe': MediaPipeFaceDetector,
+        'dnn': DnnFaceDetector,
+    }
+    if backend not in backends:
+        raise ValueError(f"Unknown face detector '{backend}', expected one of {FACE_DETECTOR_BACKENDS}")
+    return backends[backend](detection_width=detection_width, **options)
@@ -0,0 +1,62 @@
+from typing import Dict, Union
+
+import cv2
+import numpy as np
+
+
+class FrameContext:
+    """
+    Per-frame images and statistics shared by the analysis stages
+    
+    Derived images are computed on first use and reused afterwards, so the
+    frame is converted to grayscale only once however many stages need it.
+    """
+    __slots__ = ('frame', '_gray', '_equalized', '_channel_means', '_brightness')
+    
+    def __init__(self, frame: np.ndarray):
+        self.frame = frame
+        self._gray = None
+        self._equalized = None
+        self._channel_means = None
+        self._brightness = None
+    
+    @property
+    def shape(self) -> tuple:
+        return self.frame.shape
+    
+    @property
+    def gray(self) -> np.ndarray:
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+        return self._gray
+    
+    @property
+    def equalized(self) -> np.ndarray:
+        """
+        Histogram-equalised grayscale image
+        """
+        if self._equalized is None:
+            self._equalized = cv2.equalizeHist(self.gray)
+        return self._equalized
+    
+    @property
+    def channel_means(self) -> Dict[str, float]:
+        if self._channel_means is None:
+            b, g, r = cv2.mean(self.frame)[:3]
+            self._channel_means = {'blue': b, 'green': g, 'red': r}
+        return self._channel_means
+    
+    @property
+    def brightness(self) -> float:
+        if self._brightness is None:
+            self._brightness = cv2.mean(self.gray)[0]
+        return self._brightness
+
+
+def as_frame_context(frame: Union[np.ndarray, FrameContext]) -> FrameContext:
+    """
+    Wrap a raw frame in a FrameContext, passing existing contexts through
+    """
+    if isinstance(frame, FrameContext):
+        return frame
+    return FrameContext(frame)
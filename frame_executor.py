@@ -0,0 +1,372 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from frame_ring import SharedFrameRing, resolve_frame
+from metrics import STAGE_OUTCOMES_KEY, STAGE_TIMINGS_KEY, AnalysisMetrics
+from simple_video_processor import SimpleVideoProcessor
+
+EXECUTOR_MODES = ('inline', 'thread', 'process')
+
+# Factory for processors created inside pool workers
+_processor_factory: Callable[..., SimpleVideoProcessor] = SimpleVideoProcessor
+
+# Processors owned by a pool worker process, keyed by session id. Frames of
+# a session may land on any worker, so these do not track faces between
+# frames; each one only keeps the change gate state of the frames it saw.
+_WORKER_PROCESSOR_LIMIT = 64
+_worker_processors: "OrderedDict[str, SimpleVideoProcessor]" = OrderedDict()
+
+# Per-thread processor for frames analyzed independently of their session
+_local = threading.local()
+
+
+class ExecutorSaturatedError(Exception):
+    """
+    Raised when the analysis queue is full and the frame should be retried later
+    """
+
+
+def init_worker(processor_factory: Callable[..., SimpleVideoProcessor]):
+    global _processor_factory
+    _processor_factory = processor_factory
+
+
+def _worker_processor(session_id: str) -> SimpleVideoProcessor:
+    """
+    Get the processor a worker process keeps for a session
+
+    The least recently used processor is closed once the worker keeps more
+    than _WORKER_PROCESSOR_LIMIT of them.
+    """
+    processor = _worker_processors.get(session_id)
+    if processor is None:
+        processor = _processor_factory(track_faces=False)
+        _worker_processors[session_id] = processor
+        if len(_worker_processors) > _WORKER_PROCESSOR_LIMIT:
+            _, evicted = _worker_processors.popitem(last=False)
+            evicted.close()
+    else:
+        _worker_processors.move_to_end(session_id)
+    return processor
+
+
+def _analyze_in_worker(session_id: str, method: str, *args) -> Dict:
+    """
+    Run an analyze_* method of the worker's processor for a session
+    """
+    return getattr(_worker_processor(session_id), method)(*map(resolve_frame, args))
+
+
+def analyze_independent(method: str, *args) -> Dict:
+    """
+    Run an analyze_* method on this thread's processor without tracking state
+
+    Used for frames analyzed out of order, so no face tracking is carried
+    over and no frame is compared with the previous one.
+    """
+    processor = getattr(_local, 'processor', None)
+    if processor is None:
+        processor = _processor_factory(track_faces=False, skip_unchanged=False)
+        _local.processor = processor
+    return getattr(processor, method)(*map(resolve_frame, args))
+
+
+def _analyze_and_record(processor: SimpleVideoProcessor, method: str, *args) -> Dict:
+    """
+    Run an analyze_* method and record the result while holding the session processor lock
+
+    Recording reaches the session store, so it happens here rather than on
+    the event loop. The stage timings and outcomes stay attached for the metrics.
+    """
+    with processor.lock:
+        analysis = getattr(processor, method)(*args)
+        stage_stats = {key: analysis.pop(key) for key in (STAGE_TIMINGS_KEY, STAGE_OUTCOMES_KEY)
+                       if key in analysis}
+        processor.record_analysis(analysis)
+        analysis.update(stage_stats)
+        return analysis
+
+
+def _record_locked(processor: SimpleVideoProcessor, analyses: Sequence[Dict],
+                   timestamps: Optional[Sequence[Optional[str]]] = None):
+    """
+    Record analyses in order while holding the session processor lock
+
+    timestamps, when given, holds the capture time to record for each analysis.
+    """
+    with processor.lock:
+        for analysis, timestamp in zip(analyses, timestamps or [None] * len(analyses)):
+            processor.record_analysis(analysis, timestamp)
+
+
+class FrameExecutor:
+    def __init__(self, mode: str = 'thread', max_workers: Optional[int] = None,
+                 max_pending: Optional[int] = None,
+                 processor_factory: Callable[..., SimpleVideoProcessor] = SimpleVideoProcessor,
+                 metrics: Optional[AnalysisMetrics] = None, share_frames: bool = True,
+                 frame_slot_bytes: int = 1024 * 1024):
+        """
+        Runs frame analysis off the event loop
+
+        Args:
+            mode: 'inline' (on the event loop), 'thread' or 'process' pool
+            max_workers: Pool size, defaults to the number of CPU cores
+            max_pending: Frames allowed in flight before new ones are rejected
+            processor_factory: Builds the processors used inside pool workers
+            metrics: Receives frame counts and stage timings of every analysis
+            share_frames: In process mode, hand frames to workers through shared memory instead of pickling them
+            frame_slot_bytes: Largest encoded frame passed through shared memory
+        """
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode '{mode}', expected one of {EXECUTOR_MODES}")
+
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self.pending = 0
+        self.metrics = metrics or AnalysisMetrics()
+        # Smoothed seconds from submitting a frame to its result
+        self.frame_seconds: Optional[float] = None
+        # In process mode, a future per session that is done once the
+        # session's last submitted frame has been recorded
+        self._recorded: Dict[str, asyncio.Future] = {}
+
+        init_worker(processor_factory)
+        if mode == 'thread':
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix='frame-analysis')
+        elif mode == 'process':
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             initializer=init_worker,
+                                             initargs=(processor_factory,))
+        else:
+            self._pool = None
+
+        # One slot per frame that may be in flight, so frames only fall back
+        # to pickling when they are too large
+        self.frame_ring: Optional[SharedFrameRing] = None
+        if mode == 'process' and share_frames:
+            try:
+                self.frame_ring = SharedFrameRing(slots=self.max_pending, slot_bytes=frame_slot_bytes)
+            except OSError as e:
+                print(f"Error creating shared frame ring, frames will be pickled: {e}")
+
+    @property
+    def saturated(self) -> bool:
+        return self.pending >= self.max_pending
+
+    @property
+    def load(self) -> float:
+        """
+        Fraction of max_pending currently in flight
+        """
+        return min(self.pending / self.max_pending, 1.0)
+
+    def _record_latency(self, seconds: float):
+        if self.frame_seconds is None:
+            self.frame_seconds = seconds
+        else:
+            self.frame_seconds = 0.8 * self.frame_seconds + 0.2 * seconds
+
+    async def submit(self, fn, *args) -> Any:
+        """
+        Run fn(*args) on the pool, rejecting work once max_pending is reached
+
+        Raises:
+            ExecutorSaturatedError: If too many frames are already in flight
+        """
+        if self.saturated:
+            self.metrics.rejected.inc()
+            raise ExecutorSaturatedError(
+                f"Analysis queue is full ({self.pending}/{self.max_pending} frames pending)"
+            )
+
+        return await self._run(fn, *args)
+
+    async def _run(self, fn, *args) -> Any:
+        self.pending += 1
+        try:
+            return await self._execute(fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def _execute(self, fn, *args) -> Any:
+        """
+        Run fn(*args) on the pool; the caller accounts for it in pending
+        """
+        if self._pool is None:
+            return fn(*args)
+        if self.frame_ring is not None:
+            return await self._run_shared(fn, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, fn, *args)
+
+    async def _run_shared(self, fn, *args) -> Any:
+        """
+        Run fn on the process pool with frame arguments passed through the shared memory ring
+        """
+        args = [self.frame_ring.share(arg) for arg in args]
+
+        def release(_=None):
+            for arg in args:
+                self.frame_ring.release(arg)
+
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            release()
+            raise
+        # Slots are freed once the worker is done, even if the caller stopped waiting
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    async def analyze(self, session_id: str, processor: SimpleVideoProcessor,
+                      method: str, *args) -> Dict:
+        """
+        Run processor.<method>(*args) for a session and record the result
+
+        The result is recorded on the pool thread that analyzed it. In process
+        mode the analysis runs on the worker's own processor for the session,
+        without face tracking, and the result is recorded in the session
+        processor on a thread, in the order the session's frames were submitted.
+        """
+        if self.mode == 'process':
+            return await self._analyze_in_process(session_id, processor, method, *args)
+
+        return await self._observe(self.submit(_analyze_and_record, processor, method, *args))
+
+    async def _observe(self, analysis_call) -> Dict:
+        """
+        Await an analysis and add it to the metrics
+        """
+        start_time = time.perf_counter()
+        try:
+            analysis = await analysis_call
+        except ExecutorSaturatedError:
+            raise
+        except Exception:
+            self.metrics.errors.inc(reason='exception')
+            raise
+
+        seconds = time.perf_counter() - start_time
+        self.metrics.observe_analysis(analysis, seconds)
+        self._record_latency(seconds)
+        return analysis
+
+    async def _analyze_in_process(self, session_id: str, processor: SimpleVideoProcessor,
+                                  method: str, *args) -> Dict:
+        """
+        Analyze a frame on the process pool and record it after the session's earlier frames
+        """
+        previous = self._recorded.get(session_id)
+        recorded = asyncio.get_running_loop().create_future()
+        self._recorded[session_id] = recorded
+        try:
+            analysis = await self._observe(self.submit(_analyze_in_worker, session_id, method, *args))
+            if previous is not None:
+                # Waits without being cancelled along with the earlier frame
+                await asyncio.wait([previous])
+            await self._record(processor, [analysis])
+            return analysis
+        finally:
+            recorded.set_result(None)
+            if self._recorded.get(session_id) is recorded:
+                del self._recorded[session_id]
+
+    async def _record(self, processor: SimpleVideoProcessor, analyses: Sequence[Dict],
+                      timestamps: Optional[Sequence[Optional[str]]] = None):
+        """
+        Record analyses in the session processor, off the event loop unless running inline
+
+        Recording updates the session store, which may wait for a database
+        lock or a Redis round trip, and appends to the session log.
+        """
+        if self._pool is None:
+            _record_locked(processor, analyses, timestamps)
+        else:
+            await asyncio.to_thread(_record_locked, processor, analyses, timestamps)
+
+    async def analyze_batch(self, processor: SimpleVideoProcessor, method: str,
+                            frames: Sequence[tuple],
+                            timestamps: Optional[Sequence[Optional[str]]] = None) -> List[Dict]:
+        """
+        Analyze independent frames in parallel and record them in order
+
+        Each item of frames is the argument tuple for processor.<method>.
+        timestamps, when given, holds the time each frame was captured; frames
+        without one are recorded with the time they were analyzed.
+        At most max_workers frames of the batch are in flight at a time, and
+        that many pending slots are reserved for the whole batch up front.
+
+        Raises:
+            ExecutorSaturatedError: If the queue has no room for the batch's frames in flight
+        """
+        in_flight = min(len(frames), self.max_workers, self.max_pending)
+        if self.pending + in_flight > self.max_pending:
+            self.metrics.rejected.inc(len(frames))
+            raise ExecutorSaturatedError(
+                f"Analysis queue is full ({self.pending}/{self.max_pending} frames pending)"
+            )
+
+        slots = asyncio.Semaphore(in_flight)
+
+        async def run_one(args: tuple) -> Dict:
+            async with slots:
+                start_time = time.perf_counter()
+                analysis = await self._execute(analyze_independent, method, *args)
+                seconds = time.perf_counter() - start_time
+                self.metrics.observe_analysis(analysis, seconds)
+                self._record_latency(seconds)
+                return analysis
+
+        self.pending += in_flight
+        try:
+            results = await asyncio.gather(*(run_one(args) for args in frames))
+        finally:
+            self.pending -= in_flight
+        await self._record(processor, results, timestamps)
+        return results
+
+    async def warm_up(self) -> Dict:
+        """
+        Warm up the pool workers by running a blank frame through them
+
+        max_workers warm-ups are submitted at once (one in inline mode). The
+        pool usually spreads them one per worker, but does not guarantee it,
+        so a worker may stay cold until its first frame. Each warm-up builds
+        the analyze_independent processor of the worker it lands on and loads
+        what is shared per process, such as DeepFace models and OpenCV's
+        first-use setup. Session processors are not warmed: they are built
+        and load their own cascades when a session is first used. Returns
+        whether all warm-ups loaded their models and the slowest time.
+        """
+        count = self.max_workers if self._pool is not None else 1
+        results = await asyncio.gather(
+            *(self._run(analyze_independent, "warm_up") for _ in range(count))
+        )
+        return {
+            'ready': all(result['ready'] for result in results),
+            'seconds': max(result['seconds'] for result in results)
+        }
+
+    def status(self) -> Dict:
+        return {
+            'mode': self.mode,
+            'workers': self.max_workers if self._pool else 0,
+            'pending_frames': self.pending,
+            'max_pending_frames': self.max_pending,
+            'frame_seconds': round(self.frame_seconds, 4) if self.frame_seconds is not None else None,
+            'frame_ring': self.frame_ring.status() if self.frame_ring is not None else None
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        if self.frame_ring is not None:
+            # Workers still mapping the memory keep it until they exit
+            self.frame_ring.close()
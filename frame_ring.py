@@ -0,0 +1,126 @@
+import threading
+from multiprocessing import shared_memory
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+# Shared memory blocks attached by this (worker) process, by name
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+_attach_lock = threading.Lock()
+
+
+class FrameRef(NamedTuple):
+    """
+    Picklable handle of a frame in a SharedFrameRing slot
+
+    shape and dtype are None for encoded bytes.
+    """
+    name: str
+    slot: int
+    offset: int
+    nbytes: int
+    shape: Optional[Tuple[int, ...]] = None
+    dtype: Optional[str] = None
+
+
+class SharedFrameRing:
+    def __init__(self, slots: int = 16, slot_bytes: int = 1024 * 1024):
+        """
+        Ring of fixed-size shared memory slots for handing frames to worker processes
+
+        The owning process copies a frame (encoded bytes or a decoded array)
+        into a free slot once and passes only the small FrameRef to the
+        worker, which reads the slot in place instead of unpickling a copy.
+        The slot must be released once the worker is done with it. When no
+        slot is free or a frame does not fit, put returns None and the caller
+        sends the frame the usual way.
+
+        Args:
+            slots: Frames that can be in flight at once
+            slot_bytes: Largest frame, in bytes, a slot holds
+        """
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+
+        self.frames_shared = 0
+        self.fallbacks = 0
+
+        self._free = list(range(slots))
+        self._lock = threading.Lock()
+
+    def put(self, data: Union[bytes, memoryview, np.ndarray]) -> Optional[FrameRef]:
+        """
+        Copy a frame into a free slot, or return None if it cannot be shared
+        """
+        is_array = isinstance(data, np.ndarray)
+        nbytes = data.nbytes if is_array else len(data)
+        with self._lock:
+            if nbytes > self.slot_bytes or not self._free:
+                self.fallbacks += 1
+                return None
+            slot = self._free.pop()
+            self.frames_shared += 1
+
+        offset = slot * self.slot_bytes
+        if is_array:
+            np.ndarray(data.shape, dtype=data.dtype, buffer=self.shm.buf, offset=offset)[...] = data
+            return FrameRef(self.shm.name, slot, offset, nbytes, data.shape, data.dtype.str)
+        self.shm.buf[offset:offset + nbytes] = data
+        return FrameRef(self.shm.name, slot, offset, nbytes)
+
+    def share(self, data: Any) -> Any:
+        """
+        FrameRef for data if it is a frame that fits a free slot, otherwise data itself
+        """
+        if isinstance(data, (bytes, np.ndarray)):
+            ref = self.put(data)
+            if ref is not None:
+                return ref
+        return data
+
+    def release(self, ref: Any):
+        """
+        Make the slot of a FrameRef from put available again; other values are ignored
+        """
+        if isinstance(ref, FrameRef):
+            with self._lock:
+                self._free.append(ref.slot)
+
+    def status(self) -> Dict:
+        return {
+            'slots': self.slots,
+            'free_slots': len(self._free),
+            'slot_bytes': self.slot_bytes,
+            'frames_shared': self.frames_shared,
+            'fallbacks': self.fallbacks
+        }
+
+    def close(self):
+        """
+        Free the shared memory; no worker may still be reading a slot
+        """
+        self.shm.close()
+        self.shm.unlink()
+
+
+def resolve_frame(arg: Any) -> Any:
+    """
+    The frame a FrameRef points to, read in place; other values are returned as they are
+
+    Decoded frames come back as read-only arrays and encoded frames as a
+    memoryview. Both are only valid until the owner releases the slot, so
+    they must not be kept after the analysis returns.
+    """
+    if not isinstance(arg, FrameRef):
+        return arg
+    with _attach_lock:
+        shm = _attached.get(arg.name)
+        if shm is None:
+            shm = shared_memory.SharedMemory(name=arg.name)
+            _attached[arg.name] = shm
+    if arg.shape is None:
+        return shm.buf[arg.offset:arg.offset + arg.nbytes]
+    frame = np.ndarray(arg.shape, dtype=np.dtype(arg.dtype), buffer=shm.buf, offset=arg.offset)
+    frame.flags.writeable = False
+    return frame
@@ -0,0 +1,106 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+
+class FrameWriter:
+    def __init__(self, output_dir: str = "video_analysis_output/frames", max_queue: int = 64,
+                 quota_bytes: int = 512 * 1024 * 1024, batch_size: int = 8):
+        """
+        Persists sampled frames on a background thread
+
+        Frames are written from the encoded bytes the client sent, so nothing
+        is re-encoded. When the queue is full or the disk quota is used up,
+        new frames are dropped instead of slowing down analysis.
+
+        Args:
+            output_dir: Folder the frames are written to
+            max_queue: Frames waiting to be written before new ones are dropped
+            quota_bytes: Total bytes this writer may write
+            batch_size: Frames written per wake-up of the writer thread
+        """
+        self.output_dir = output_dir
+        self.quota_bytes = quota_bytes
+        self.batch_size = batch_size
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self.bytes_reserved = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.write_errors = 0
+
+        self._sequence = itertools.count(1)
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="frame-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, session_id: str, image_data: bytes, extension: str = ".jpg") -> Optional[str]:
+        """
+        Queue encoded image bytes for writing
+
+        Returns:
+            The path the frame will be written to, or None if it was dropped
+        """
+        size = len(image_data)
+        with self._lock:
+            if self.bytes_reserved + size > self.quota_bytes:
+                self.frames_dropped += 1
+                return None
+            self.bytes_reserved += size
+            sequence = next(self._sequence)
+
+        # The process id keeps names unique when several API workers share the folder
+        filename = f"frame_{session_id}_{int(time.time() * 1000)}_{os.getpid()}_{sequence:06d}{extension}"
+        path = os.path.join(self.output_dir, filename)
+        try:
+            self._queue.put_nowait((path, image_data))
+        except queue.Full:
+            with self._lock:
+                self.bytes_reserved -= size
+                self.frames_dropped += 1
+            return None
+        return path
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Drain whatever else is waiting to write it in one go
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            for entry in batch:
+                if entry is None:
+                    return
+                path, image_data = entry
+                try:
+                    with open(path, 'wb') as f:
+                        f.write(image_data)
+                    self.frames_written += 1
+                except Exception as e:
+                    print(f"Error saving frame: {e}")
+                    self.write_errors += 1
+
+    def status(self) -> Dict:
+        return {
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'frames_queued': self._queue.qsize(),
+            'bytes_used': self.bytes_reserved,
+            'quota_bytes': self.quota_bytes
+        }
+
+    def close(self, timeout: float = 5.0):
+        """
+        Write the frames still queued and stop the writer thread
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
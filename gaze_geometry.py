@@ -0,0 +1,71 @@
+import numpy as np
+
+
+def box_centers(boxes: np.ndarray) -> np.ndarray:
+    """
+    Centers of (x, y, w, h) boxes as an (N, 2) float array
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return boxes[:, :2] + boxes[:, 2:] / 2
+
+
+def pairwise_iou(boxes: np.ndarray) -> np.ndarray:
+    """
+    IoU of every pair of (x, y, w, h) boxes as an (N, N) array
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    inter_w = np.clip(np.minimum(x1[:, None], x1[None, :]) - np.maximum(x0[:, None], x0[None, :]), 0, None)
+    inter_h = np.clip(np.minimum(y1[:, None], y1[None, :]) - np.maximum(y0[:, None], y0[None, :]), 0, None)
+    inter = inter_w * inter_h
+    area = boxes[:, 2] * boxes[:, 3]
+    union = area[:, None] + area[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def suppress_duplicate_boxes(boxes: np.ndarray, min_distance: float = 30.0,
+                             iou_threshold: float = 0.5) -> np.ndarray:
+    """
+    Indices of boxes kept after removing duplicates
+
+    A box is a duplicate of an earlier kept box when their centers are closer
+    than min_distance or their IoU exceeds iou_threshold. Earlier boxes win,
+    so pass the most trusted detector's results first.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    count = len(boxes)
+    if count < 2:
+        return np.arange(count)
+
+    centers = box_centers(boxes)
+    distances = np.linalg.norm(centers[:, None, :] - centers[None, :, :], axis=-1)
+    duplicate = (distances < min_distance) | (pairwise_iou(boxes) > iou_threshold)
+
+    keep = np.ones(count, dtype=bool)
+    for i in range(count):
+        if keep[i]:
+            later = duplicate[i, i + 1:]
+            keep[i + 1:] &= ~later
+    return np.flatnonzero(keep)
+
+
+def gaze_direction(norm_offset_x: float, norm_offset_y: float, eye_angle: float) -> str:
+    """
+    Gaze direction label of a single eye-line offset, normalized by the frame center
+
+    Same thresholds as SimpleVideoProcessor.determine_gaze_direction_improved.
+    """
+    if abs(eye_angle) > 15:
+        return 'tilted_right' if eye_angle > 0 else 'tilted_left'
+    if abs(norm_offset_x) < 0.15 and abs(norm_offset_y) < 0.15:
+        return 'center'
+    if norm_offset_x < -0.25:
+        return 'left'
+    if norm_offset_x > 0.25:
+        return 'right'
+    if norm_offset_y < -0.25:
+        return 'up'
+    if norm_offset_y > 0.25:
+        return 'down'
+    return 'center'
@@ -0,0 +1,158 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from gaze_geometry import gaze_direction
+
+# Gaze states of GazeStateTracker
+LOOKING = 'looking'
+AWAY = 'away'
+NO_FACE = 'no_face'
+
+
+class GazeStateTracker:
+    def __init__(self, alpha: float = 0.3, away_below: float = 0.35, looking_above: float = 0.65,
+                 look_away_seconds: float = 3.0, face_lost_seconds: float = 2.0):
+        """
+        Smoothed gaze state of one session with debounced events
+
+        Each frame updates exponential moving averages of "looking at the
+        screen" and of the eye-line offset from the frame center. The state
+        only switches to away below away_below and back above looking_above,
+        so single misclassified frames do not make it flicker. Events are
+        emitted once per episode: 'looked_away' after look_away_seconds away,
+        'face_lost' after face_lost_seconds without a face, and 'looked_back'
+        / 'face_found' when such an episode ends. Each event carries the
+        episode length in seconds. Every update is O(1).
+
+        Args:
+            alpha: Weight of the newest frame in the moving averages
+            away_below: Smoothed looking score under which the user counts as looking away
+            looking_above: Smoothed looking score over which the user counts as looking again
+            look_away_seconds: Time away before a 'looked_away' event
+            face_lost_seconds: Time without a face before a 'face_lost' event
+        """
+        self.alpha = alpha
+        self.away_below = away_below
+        self.looking_above = looking_above
+        self.look_away_seconds = look_away_seconds
+        self.face_lost_seconds = face_lost_seconds
+
+        self.state = LOOKING
+        self.state_since: Optional[float] = None
+        self.looking_score = 1.0
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+        self.eye_angle = 0.0
+        self.event_counts: Dict[str, int] = {}
+
+        # Whether the current away / no_face episode already produced its event
+        self._reported = False
+        self._last_face_time: Optional[float] = None
+
+    def state_dict(self) -> Dict:
+        """
+        Tracking state as a JSON-ready dict, see load_state
+        """
+        return {
+            'state': self.state,
+            'state_since': self.state_since,
+            'looking_score': self.looking_score,
+            'offset_x': self.offset_x,
+            'offset_y': self.offset_y,
+            'eye_angle': self.eye_angle,
+            'event_counts': dict(self.event_counts),
+            'reported': self._reported,
+            'last_face_time': self._last_face_time
+        }
+
+    def load_state(self, state: Dict):
+        """
+        Continue from a state_dict, e.g. one saved by another worker process
+        """
+        self.state = state['state']
+        self.state_since = state['state_since']
+        self.looking_score = state['looking_score']
+        self.offset_x = state['offset_x']
+        self.offset_y = state['offset_y']
+        self.eye_angle = state['eye_angle']
+        self.event_counts = dict(state['event_counts'])
+        self._reported = state['reported']
+        self._last_face_time = state['last_face_time']
+
+    def _smooth(self, average: float, value: float) -> float:
+        return average + self.alpha * (value - average)
+
+    def _enter(self, state: str, now: float):
+        self.state = state
+        self.state_since = now
+        self._reported = False
+
+    def _event(self, events: List[Dict], event_type: str, now: float, **details):
+        self.event_counts[event_type] = self.event_counts.get(event_type, 0) + 1
+        events.append(dict(type=event_type, at=datetime.fromtimestamp(now).isoformat(), **details))
+
+    def update(self, analysis: Dict, now: Optional[float] = None) -> Dict:
+        """
+        Feed one frame analysis; returns the smoothed state and any new events
+
+        Args:
+            analysis: Result of SimpleVideoProcessor.analyze_frame_simple
+            now: Frame time in seconds, defaults to the analysis timestamp
+        """
+        if now is None:
+            now = datetime.fromisoformat(analysis['timestamp']).timestamp()
+        if self.state_since is None:
+            self.state_since = now
+
+        events = []
+        gaze = (analysis.get('eye_analysis') or {}).get('gaze_analysis')
+        has_face = analysis.get('faces_detected', 0) > 0
+
+        if has_face:
+            self._last_face_time = now
+            looking = bool(gaze and gaze.get('is_looking_at_screen'))
+            self.looking_score = self._smooth(self.looking_score, 1.0 if looking else 0.0)
+
+            positions = gaze.get('eye_positions') if gaze else None
+            frame_center = gaze.get('frame_center') if gaze else None
+            if positions and frame_center:
+                eye_x, eye_y = positions['eye_line_center']
+                self.offset_x = self._smooth(self.offset_x, (eye_x - frame_center[0]) / frame_center[0])
+                self.offset_y = self._smooth(self.offset_y, (eye_y - frame_center[1]) / frame_center[1])
+                self.eye_angle = self._smooth(self.eye_angle, positions['eye_angle'])
+
+            if self.state == NO_FACE:
+                if self._reported:
+                    self._event(events, 'face_found', now, seconds=round(now - self.state_since, 2))
+                self._enter(LOOKING if self.looking_score >= self.away_below else AWAY, now)
+            elif self.state == LOOKING and self.looking_score < self.away_below:
+                self._enter(AWAY, now)
+            elif self.state == AWAY and self.looking_score > self.looking_above:
+                if self._reported:
+                    self._event(events, 'looked_back', now, seconds=round(now - self.state_since, 2))
+                self._enter(LOOKING, now)
+        elif self.state != NO_FACE:
+            # A face must be missing for a while before the state changes
+            last_face_time = self._last_face_time if self._last_face_time is not None else self.state_since
+            if now - last_face_time >= self.face_lost_seconds:
+                self._enter(NO_FACE, last_face_time)
+
+        state_seconds = now - self.state_since
+        if not self._reported:
+            if self.state == AWAY and state_seconds >= self.look_away_seconds:
+                self._event(events, 'looked_away', now, seconds=round(state_seconds, 2))
+                self._reported = True
+            elif self.state == NO_FACE and state_seconds >= self.face_lost_seconds:
+                self._event(events, 'face_lost', now, seconds=round(state_seconds, 2))
+                self._reported = True
+
+        return {
+            'state': {
+                'state': self.state,
+                'state_seconds': round(state_seconds, 2),
+                'looking_score': round(self.looking_score, 3),
+                'is_looking_at_screen': self.state == LOOKING,
+                'gaze_direction': gaze_direction(self.offset_x, self.offset_y, self.eye_angle)
+            },
+            'events': events
+        }
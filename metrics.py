@@ -0,0 +1,226 @@
+import bisect
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Sequence, Tuple
+
+# Key under which processors attach per-stage seconds to an analysis.
+# It is removed again before the analysis is recorded or returned.
+STAGE_TIMINGS_KEY = '_stage_seconds'
+
+# Key under which processors attach what a stage did for the frame, e.g.
+# {'face_search': 'tracked'}. It is removed together with the stage timings.
+STAGE_OUTCOMES_KEY = '_stage_outcomes'
+
+# Histogram buckets in seconds, from a cheap stage to a slow full frame
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type_name = ''
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._sample_lines())
+        return '\n'.join(lines)
+
+    def _sample_lines(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _sample_lines(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.label_names:
+            values = [((), 0)]
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+
+    def _sample_lines(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Named metrics rendered together in the Prometheus text exposition format
+        """
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labels, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+class RateMeter:
+    def __init__(self, window: float = 10.0):
+        """
+        Events per second over the last window seconds
+        """
+        self.window = window
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def mark(self, count: int = 1):
+        now = time.monotonic()
+        with self._lock:
+            self._events.append((now, count))
+            self._expire(now)
+
+    def _expire(self, now: float):
+        while self._events and self._events[0][0] < now - self.window:
+            self._events.popleft()
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            return sum(count for _, count in self._events) / self.window
+
+
+class AnalysisMetrics:
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        """
+        Instruments for frame analysis: counters, stage histograms and frame rate
+        """
+        self.registry = registry or MetricsRegistry()
+        self.frames = self.registry.counter(
+            'video_frames_analyzed_total', 'Frames analyzed')
+        self.errors = self.registry.counter(
+            'video_frame_errors_total', 'Frames that could not be analyzed', labels=('reason',))
+        self.rejected = self.registry.counter(
+            'video_frames_rejected_total', 'Frames rejected because the analysis queue was full')
+        self.dropped = self.registry.counter(
+            'video_frames_dropped_total',
+            'Stream frames not analyzed, superseded by a newer frame or dropped by the saturated executor',
+            labels=('reason',))
+        self.unchanged = self.registry.counter(
+            'video_frames_unchanged_total', 'Frames answered with the previous analysis because they had not changed')
+        self.analysis_seconds = self.registry.histogram(
+            'video_analysis_seconds', 'Time from submitting a frame to its result, including queueing')
+        self.stage_seconds = self.registry.histogram(
+            'video_analysis_stage_seconds', 'Time spent in each analysis stage', labels=('stage',))
+        self.stage_outcomes = self.registry.counter(
+            'video_analysis_stage_outcomes_total', 'Frames by what an analysis stage did for them',
+            labels=('stage', 'outcome'))
+        self.frame_rate = RateMeter()
+
+    def observe_analysis(self, analysis: Dict, seconds: Optional[float] = None):
+        """
+        Record one analysis result, removing its attached stage timings and outcomes
+        """
+        for stage, stage_seconds in (analysis.pop(STAGE_TIMINGS_KEY, None) or {}).items():
+            self.stage_seconds.observe(stage_seconds, stage=stage)
+        for stage, outcome in (analysis.pop(STAGE_OUTCOMES_KEY, None) or {}).items():
+            self.stage_outcomes.inc(stage=stage, outcome=outcome)
+        if seconds is not None:
+            self.analysis_seconds.observe(seconds)
+
+        if 'error' in analysis:
+            self.errors.inc(reason='analysis' if 'timestamp' in analysis else 'decode')
+        else:
+            self.frames.inc()
+            self.frame_rate.mark()
+            if analysis.get('unchanged_frame'):
+                self.unchanged.inc()
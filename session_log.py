@@ -0,0 +1,111 @@
+import gzip
+import json
+import os
+import time
+from typing import Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_line(analysis: Dict) -> str:
+    """
+    Compact JSON for one log line, using orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(analysis, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(analysis, separators=(',', ':'))
+
+
+class SessionLog:
+    def __init__(self, output_dir: str, name: str, compress: bool = False,
+                 flush_interval: float = 1.0):
+        """
+        Append-only JSON Lines log of the frame analyses of one session
+
+        Every analysis is written as it arrives, so the cost per frame is
+        constant. The file is flushed at most every flush_interval seconds
+        and when it is closed, so a crash loses at most that much of the
+        log. Flushing a gzip stream ends its current deflate block, so
+        flushing every line would undo most of the compression.
+
+        Args:
+            output_dir: Folder the log files are written to
+            name: File name prefix
+            compress: Write gzip-compressed .jsonl.gz files
+            flush_interval: Seconds between flushes of the log file
+        """
+        self.output_dir = output_dir
+        self.name = name
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.part = 0
+        self.lines = 0
+        self._file = None
+        self._path = None
+        self._next_flush = 0.0
+
+    @property
+    def path(self) -> Optional[str]:
+        """
+        File currently being written, or None before the first frame
+        """
+        return self._path
+
+    def _open(self):
+        self.part += 1
+        extension = '.jsonl.gz' if self.compress else '.jsonl'
+        filename = f"{self.name}_{int(time.time())}_{self.part:03d}{extension}"
+        self._path = os.path.join(self.output_dir, filename)
+        if self.compress:
+            self._file = gzip.open(self._path, 'at', encoding='utf-8')
+        else:
+            self._file = open(self._path, 'a', encoding='utf-8')
+        self.lines = 0
+
+    def append(self, analysis: Dict):
+        """
+        Write one frame analysis as a JSON line
+        """
+        try:
+            if self._file is None:
+                self._open()
+            self._file.write(dumps_line(analysis) + '\n')
+            self.lines += 1
+            now = time.monotonic()
+            if now >= self._next_flush:
+                self._file.flush()
+                self._next_flush = now + self.flush_interval
+        except Exception as e:
+            print(f"Error writing session log: {e}")
+
+    def rotate(self, summary: Optional[Dict] = None) -> Optional[str]:
+        """
+        Close the current log file and start a new one on the next frame
+
+        Args:
+            summary: Written next to the closed log as <log>.summary.json
+
+        Returns:
+            Path of the closed log file, or None if nothing was logged
+        """
+        if self._file is None:
+            return None
+
+        path = self._path
+        try:
+            self._file.close()
+            if summary is not None:
+                with open(f"{path}.summary.json", 'w') as f:
+                    json.dump(summary, f, indent=2)
+        except Exception as e:
+            print(f"Error finalising session log: {e}")
+        finally:
+            self._file = None
+            self._path = None
+        return path
+
+    def close(self, summary: Optional[Dict] = None) -> Optional[str]:
+        return self.rotate(summary)
@@ -0,0 +1,205 @@
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from simple_video_processor import SimpleVideoProcessor
+from session_store import MemorySessionStore, SessionStore
+
+# Seconds between sweeps for idle sessions in a shared store
+STORE_EVICTION_INTERVAL = 10.0
+
+# Session ids are generated as uuid4 hex and become part of log and frame file names
+SESSION_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+class SessionLimitError(Exception):
+    """
+    Raised when a new session would exceed the live session cap
+    """
+
+
+class SessionRegistry:
+    def __init__(self, processor_factory: Callable[..., SimpleVideoProcessor] = SimpleVideoProcessor,
+                 max_sessions: int = 64, idle_timeout: float = 600.0,
+                 store: Optional[SessionStore] = None):
+        """
+        Keeps one processor per rehearsal session
+
+        Sessions themselves live in the store. With a shared store any worker
+        process can serve any session: a processor is built the first time
+        this process sees one of its frames, so no session affinity is needed.
+        Methods that reach a shared store wait on it, so async callers run
+        them on a thread; touch and live_sessions never reach the store.
+
+        Args:
+            processor_factory: Callable building a fresh processor, given the session_id and store
+            max_sessions: Maximum number of live sessions
+            idle_timeout: Seconds without activity after which a session is evicted
+            store: Session store, defaults to an in-memory store of this process
+        """
+        self.processor_factory = processor_factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.store = store or MemorySessionStore()
+        self._next_store_eviction = 0.0
+
+        # Live sessions in the store as of this process's last create, close
+        # or eviction sweep; read without reaching the store
+        self.live_sessions = 0
+
+        # session_id -> processor, ordered from least to most recently used
+        self._sessions: "OrderedDict[str, SimpleVideoProcessor]" = OrderedDict()
+        self._last_seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.store.count()
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions or self.store.exists(session_id)
+
+    def session_ids(self) -> List[str]:
+        """
+        Ids of the sessions with a processor in this process, least recently used first
+        """
+        with self._lock:
+            return list(self._sessions)
+
+    def processors(self) -> List[SimpleVideoProcessor]:
+        """
+        Processors of the sessions seen by this process
+        """
+        with self._lock:
+            return list(self._sessions.values())
+
+    def create(self, session_id: Optional[str] = None) -> str:
+        """
+        Register a new session and return its id
+
+        Raises:
+            ValueError: If session_id is not a 32 character lowercase hex string
+        """
+        if session_id is not None and not SESSION_ID_PATTERN.fullmatch(session_id):
+            raise ValueError(f"Invalid session id, expected 32 lowercase hex characters: {session_id!r}")
+        with self._lock:
+            self._evict_idle_locked()
+            return self._create_locked(session_id)
+
+    def get(self, session_id: str, create: bool = False) -> SimpleVideoProcessor:
+        """
+        Look up the processor of a session, optionally creating it
+
+        Raises:
+            KeyError: If the session does not exist and create is False
+        """
+        with self._lock:
+            self._evict_idle_locked()
+            if session_id in self._sessions:
+                if not self.store.shared or self.store.exists(session_id):
+                    self._touch_locked(session_id)
+                    return self._sessions[session_id]
+                # Closed through another worker process
+                self._release_locked(session_id)
+            if create or self.store.exists(session_id):
+                self._create_locked(session_id)
+                return self._sessions[session_id]
+            raise KeyError(session_id)
+
+    def touch(self, session_id: str) -> bool:
+        """
+        Mark a session as active without looking it up, e.g. for every frame of a stream
+
+        Returns False if this process no longer has the session.
+        """
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._touch_locked(session_id)
+            return True
+
+    def close(self, session_id: str) -> bool:
+        """
+        Drop a session for all workers and close its processor
+
+        Returns False if the session was unknown.
+        """
+        with self._lock:
+            self._last_seen.pop(session_id, None)
+            processor = self._sessions.pop(session_id, None)
+        if processor is not None:
+            # Closing finalises the log with the summary, so the store goes last
+            processor.close()
+        deleted = self.store.delete(session_id)
+        self.live_sessions = self.store.count()
+        return deleted or processor is not None
+
+    def shutdown(self):
+        """
+        Close the processors of this process, leaving shared sessions to other workers
+        """
+        with self._lock:
+            for session_id in list(self._sessions):
+                self._release_locked(session_id)
+
+    def evict_idle(self) -> List[str]:
+        """
+        Drop every session idle for longer than idle_timeout
+        """
+        with self._lock:
+            return self._evict_idle_locked()
+
+    def _create_locked(self, session_id: Optional[str]) -> str:
+        if session_id is None:
+            session_id = uuid.uuid4().hex
+        elif session_id in self._sessions:
+            self._touch_locked(session_id)
+            return session_id
+
+        if not self.store.exists(session_id):
+            if self.store.count() >= self.max_sessions:
+                raise SessionLimitError(
+                    f"Session limit reached ({self.max_sessions} live sessions)"
+                )
+            self.store.create(session_id)
+            self.live_sessions = self.store.count()
+
+        self._sessions[session_id] = self.processor_factory(session_id=session_id, store=self.store)
+        self._last_seen[session_id] = time.monotonic()
+        return session_id
+
+    def _release_locked(self, session_id: str):
+        """
+        Close this process's processor of a session; a local store forgets the session too
+        """
+        self._sessions.pop(session_id).close()
+        del self._last_seen[session_id]
+        if not self.store.shared:
+            self.store.delete(session_id)
+
+    def _touch_locked(self, session_id: str):
+        self._sessions.move_to_end(session_id)
+        self._last_seen[session_id] = time.monotonic()
+
+    def _evict_idle_locked(self) -> List[str]:
+        now = time.monotonic()
+        cutoff = now - self.idle_timeout
+        evicted = []
+        # Sessions are kept in LRU order, so stop at the first recent one
+        for session_id in list(self._sessions):
+            if self._last_seen[session_id] > cutoff:
+                break
+            self._release_locked(session_id)
+            evicted.append(session_id)
+
+        # Other workers may have served a session since this one last did,
+        # so shared sessions expire by the store's own activity times
+        if self.store.shared and now >= self._next_store_eviction:
+            self._next_store_eviction = now + STORE_EVICTION_INTERVAL
+            evicted.extend(sid for sid in self.store.evict_idle(self.idle_timeout) if sid not in evicted)
+            self.live_sessions = self.store.count()
+        elif evicted:
+            self.live_sessions = self.store.count()
+        return evicted
@@ -0,0 +1,383 @@
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+SESSION_STORE_BACKENDS = ('memory', 'sqlite', 'redis')
+
+# Default database of the sqlite backend
+SESSION_DB_PATH = os.path.join("video_analysis_output", "sessions.sqlite3")
+
+# Replaces the state of a session given its current state (None at first)
+StateUpdate = Callable[[Optional[Dict]], Dict]
+
+
+class SessionStore:
+    """
+    Where sessions, their running counters and their tracker state live
+
+    A session's counters are added to by every recorded frame and its state
+    is a small JSON-ready dict (the gaze tracker's) that is replaced
+    atomically together with the counters. Shared stores let several API
+    worker processes serve the same session without session affinity.
+    """
+
+    # Whether other processes can see and change the sessions of this store
+    shared = False
+
+    def create(self, session_id: str) -> bool:
+        """
+        Register a session, returns False if it already existed
+        """
+        raise NotImplementedError
+
+    def exists(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Drop a session and its data, returns False if it was unknown
+        """
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def evict_idle(self, idle_timeout: float) -> List[str]:
+        """
+        Drop every session without a recorded frame for idle_timeout seconds
+        """
+        raise NotImplementedError
+
+    def record(self, session_id: str, counters: Dict[str, float], timestamp: str,
+               update_state: Optional[StateUpdate] = None) -> bool:
+        """
+        Add a frame's counters to a session and replace its state with update_state(state)
+
+        Returns False if the session does not exist.
+        """
+        raise NotImplementedError
+
+    def aggregates(self, session_id: str) -> Optional[Dict]:
+        """
+        Counters, first / last frame timestamp and state of a session, or None if unknown
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def _new_aggregates() -> Dict:
+    return {'counters': {}, 'first_timestamp': None, 'last_timestamp': None, 'state': None,
+            'last_seen': time.time()}
+
+
+def _add_counters(totals: Dict[str, float], counters: Dict[str, float]):
+    for name, value in counters.items():
+        totals[name] = totals.get(name, 0) + value
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self):
+        """
+        Sessions of this process only, for a single API worker
+        """
+        self._sessions: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def create(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id in self._sessions:
+                return False
+            self._sessions[session_id] = _new_aggregates()
+            return True
+
+    def exists(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+    def evict_idle(self, idle_timeout: float) -> List[str]:
+        cutoff = time.time() - idle_timeout
+        with self._lock:
+            evicted = [sid for sid, session in self._sessions.items() if session['last_seen'] < cutoff]
+            for session_id in evicted:
+                del self._sessions[session_id]
+        return evicted
+
+    def record(self, session_id: str, counters: Dict[str, float], timestamp: str,
+               update_state: Optional[StateUpdate] = None) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            if update_state is not None:
+                session['state'] = update_state(session['state'])
+            _add_counters(session['counters'], counters)
+            if session['first_timestamp'] is None:
+                session['first_timestamp'] = timestamp
+            session['last_timestamp'] = timestamp
+            session['last_seen'] = time.time()
+            return True
+
+    def aggregates(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            return dict(session, counters=dict(session['counters']))
+
+
+class SQLiteSessionStore(SessionStore):
+    shared = True
+
+    def __init__(self, path: str = SESSION_DB_PATH, timeout: float = 10.0):
+        """
+        Sessions in a SQLite database shared by the worker processes of one host
+
+        The database runs in WAL mode, so readers do not block the writer,
+        and each frame is recorded in one short write transaction.
+
+        Args:
+            path: Database file, created if missing
+            timeout: Seconds to wait for another process's write lock
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_seen REAL NOT NULL,
+                first_timestamp TEXT,
+                last_timestamp TEXT,
+                counters TEXT NOT NULL DEFAULT '{}',
+                state TEXT
+            )
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections may only be used by the thread that opened them
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def create(self, session_id: str) -> bool:
+        cursor = self._connection().execute(
+            "INSERT OR IGNORE INTO sessions (session_id, last_seen) VALUES (?, ?)",
+            (session_id, time.time()))
+        return cursor.rowcount == 1
+
+    def exists(self, session_id: str) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+    def delete(self, session_id: str) -> bool:
+        cursor = self._connection().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return cursor.rowcount == 1
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def evict_idle(self, idle_timeout: float) -> List[str]:
+        connection = self._connection()
+        cutoff = time.time() - idle_timeout
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            evicted = [row[0] for row in connection.execute(
+                "SELECT session_id FROM sessions WHERE last_seen < ?", (cutoff,))]
+            connection.execute("DELETE FROM sessions WHERE last_seen < ?", (cutoff,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def record(self, session_id: str, counters: Dict[str, float], timestamp: str,
+               update_state: Optional[StateUpdate] = None) -> bool:
+        connection = self._connection()
+        # Take the write lock up front, so the read-modify-write cannot interleave
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT counters, state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                connection.execute("ROLLBACK")
+                return False
+
+            totals = json.loads(row[0])
+            _add_counters(totals, counters)
+            state = json.loads(row[1]) if row[1] is not None else None
+            if update_state is not None:
+                state = update_state(state)
+            connection.execute(
+                "UPDATE sessions SET counters = ?, state = ?, last_seen = ?, last_timestamp = ?,"
+                " first_timestamp = COALESCE(first_timestamp, ?) WHERE session_id = ?",
+                (json.dumps(totals), json.dumps(state) if state is not None else None, time.time(),
+                 timestamp, timestamp, session_id))
+            connection.execute("COMMIT")
+            return True
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def aggregates(self, session_id: str) -> Optional[Dict]:
+        row = self._connection().execute(
+            "SELECT counters, first_timestamp, last_timestamp, state, last_seen"
+            " FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'counters': json.loads(row[0]),
+            'first_timestamp': row[1],
+            'last_timestamp': row[2],
+            'state': json.loads(row[3]) if row[3] is not None else None,
+            'last_seen': row[4]
+        }
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class RedisSessionStore(SessionStore):
+    shared = True
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "video_api",
+                 max_retries: int = 20):
+        """
+        Sessions in Redis (or a Redis compatible server), shared across hosts
+
+        Counters are kept in a hash per session and added with HINCRBYFLOAT.
+        State updates watch the session key and retry when another worker
+        recorded a frame of the same session in between. The redis package
+        is imported on first use.
+
+        Args:
+            url: Server URL
+            prefix: Prefix of all keys written
+            max_retries: Attempts at an update that keeps conflicting
+        """
+        self._redis = importlib.import_module('redis')
+        self.client = self._redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.max_retries = max_retries
+        self._index = f"{prefix}:sessions"
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}:session:{session_id}"
+
+    def _counters_key(self, session_id: str) -> str:
+        return f"{self.prefix}:session:{session_id}:counters"
+
+    def create(self, session_id: str) -> bool:
+        now = time.time()
+        if not self.client.hsetnx(self._key(session_id), 'last_seen', now):
+            return False
+        self.client.zadd(self._index, {session_id: now})
+        return True
+
+    def exists(self, session_id: str) -> bool:
+        return bool(self.client.exists(self._key(session_id)))
+
+    def delete(self, session_id: str) -> bool:
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(session_id), self._counters_key(session_id))
+        pipe.zrem(self._index, session_id)
+        deleted, _ = pipe.execute()
+        return deleted > 0
+
+    def count(self) -> int:
+        return self.client.zcard(self._index)
+
+    def evict_idle(self, idle_timeout: float) -> List[str]:
+        evicted = self.client.zrangebyscore(self._index, '-inf', time.time() - idle_timeout)
+        for session_id in evicted:
+            self.delete(session_id)
+        return evicted
+
+    def record(self, session_id: str, counters: Dict[str, float], timestamp: str,
+               update_state: Optional[StateUpdate] = None) -> bool:
+        key = self._key(session_id)
+        for _ in range(self.max_retries):
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    if not pipe.exists(key):
+                        return False
+                    state = None
+                    if update_state is not None:
+                        current = pipe.hget(key, 'state')
+                        state = update_state(json.loads(current) if current else None)
+
+                    now = time.time()
+                    pipe.multi()
+                    for name, value in counters.items():
+                        pipe.hincrbyfloat(self._counters_key(session_id), name, value)
+                    pipe.hsetnx(key, 'first_timestamp', timestamp)
+                    fields = {'last_timestamp': timestamp, 'last_seen': now}
+                    if state is not None:
+                        fields['state'] = json.dumps(state)
+                    pipe.hset(key, mapping=fields)
+                    pipe.zadd(self._index, {session_id: now})
+                    pipe.execute()
+                    return True
+                except self._redis.WatchError:
+                    continue
+        raise RuntimeError(f"Could not record frame of session {session_id}: too many conflicting updates")
+
+    def aggregates(self, session_id: str) -> Optional[Dict]:
+        pipe = self.client.pipeline()
+        pipe.hgetall(self._key(session_id))
+        pipe.hgetall(self._counters_key(session_id))
+        session, counters = pipe.execute()
+        if not session:
+            return None
+        return {
+            'counters': {name: float(value) for name, value in counters.items()},
+            'first_timestamp': session.get('first_timestamp'),
+            'last_timestamp': session.get('last_timestamp'),
+            'state': json.loads(session['state']) if session.get('state') else None,
+            'last_seen': float(session['last_seen'])
+        }
+
+    def close(self):
+        self.client.close()
+
+
+def create_session_store(backend: str = 'memory', **options) -> SessionStore:
+    """
+    Build a session store by name
+
+    Args:
+        backend: 'memory' (this process), 'sqlite' (processes of one host) or 'redis'
+        options: Arguments for the backend's class, e.g. path or url
+    """
+    if backend == 'memory':
+        return MemorySessionStore()
+    if backend == 'sqlite':
+        return SQLiteSessionStore(**options)
+    if backend == 'redis':
+        return RedisSessionStore(**options)
+    raise ValueError(f"Unknown session store '{backend}', expected one of {SESSION_STORE_BACKENDS}")
@@ -2,68 +2,193 @@ import cv2
 import numpy as np
 import base64
 import json
+import math
 import time
+import threading
+from contextlib import contextmanager
+from functools import partial
 from datetime import datetime
 import os
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
+from analysis_history import AnalysisHistory, frame_counters, summarize_counters
+from session_log import SessionLog
+from gaze_geometry import box_centers, suppress_duplicate_boxes
+from frame_context import FrameContext, as_frame_context
+from face_detectors import FaceDetector, create_face_detector, detect_at_scale
+from emotion_stage import EMOTION_MODELS, EmotionStage
+from emotion_batcher import get_emotion_batcher
+from gaze_tracking import GazeStateTracker
+from change_gate import FrameChangeGate
+from session_store import MemorySessionStore, SessionStore
+from analysis_store import AnalysisStore
+from metrics import STAGE_OUTCOMES_KEY, STAGE_TIMINGS_KEY
 
 class SimpleVideoProcessor:
-    def __init__(self):
+    def __init__(self, history_capacity: int = 3600, track_faces: bool = True,
+                 redetect_interval: int = 10, track_margin: float = 0.5,
+                 detection_width: Optional[int] = None, eye_roi_width: Optional[int] = None,
+                 session_id: Optional[str] = None, stream_log: bool = True,
+                 log_compress: bool = False, face_detector: str = 'haar',
+                 face_detector_options: Optional[Dict] = None, emotion_model: str = 'heuristic',
+                 emotion_batch_size: int = 0, emotion_batch_wait: float = 0.005,
+                 look_away_seconds: float = 3.0, skip_unchanged: bool = True,
+                 change_gate_options: Optional[Dict] = None, store: Optional[SessionStore] = None,
+                 analysis_store: Optional[AnalysisStore] = None):
         """
         Enhanced video processor with improved eye detection
+        
+        Args:
+            history_capacity: Number of per-frame records kept for export
+            track_faces: Search around the last face instead of the full frame
+            redetect_interval: Run full-frame face detection at least every N frames
+            track_margin: Fraction of the last face size added around it as search region
+            detection_width: Downscale frames wider than this before face detection
+            eye_roi_width: Resize face regions to this width before eye detection
+            session_id: Session the processor belongs to, used to name its log
+            stream_log: Append every recorded analysis to a JSON Lines session log
+            log_compress: Gzip the session log
+            face_detector: Face detection backend: 'haar', 'mediapipe' or 'dnn'
+            face_detector_options: Extra arguments for the face detection backend
+            emotion_model: 'heuristic' (brightness based) or 'deepface' on the primary face
+            emotion_batch_size: Batch DeepFace calls of all processors in this process, up to this many faces
+            emotion_batch_wait: Seconds a face waits for others to join its batch
+            look_away_seconds: Seconds of looking away before a 'looked_away' gaze event
+            skip_unchanged: Reuse the last analysis for frames that look the same as the last analyzed one
+            change_gate_options: Extra arguments for the FrameChangeGate deciding that
+            store: Keeps the session's counters and gaze state, defaults to a private in-memory store
+            analysis_store: Persists every recorded frame for later queries
         """
-        self.emotion_history = []
+        self.session_id = session_id
+        self.history = AnalysisHistory(capacity=history_capacity)
         self.output_dir = "video_analysis_output"
         os.makedirs(self.output_dir, exist_ok=True)
         
-        # Load face and eye detection cascades
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        # Session counters and gaze state; history only holds this process's frames
+        self.store_key = session_id or 'local'
+        if store is None:
+            store = MemorySessionStore()
+            store.create(self.store_key)
+        self.store = store
+        self.analysis_store = analysis_store
+        
+        # The log file is only created once the first analysis is recorded.
+        # With a shared store every worker process writes its own log.
+        self.log = None
+        if stream_log:
+            log_name = f"session_{self.store_key}"
+            if store.shared:
+                log_name += f"_{os.getpid()}"
+            self.log = SessionLog(self.output_dir, log_name, compress=log_compress)
+        
+        # Face detection backend and eye detection cascades
+        self.face_detector: FaceDetector = create_face_detector(
+            face_detector, detection_width=detection_width, **(face_detector_options or {})
+        )
         self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
         
         # Alternative eye detection using face landmarks
         self.eye_pair_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye_tree_eyeglasses.xml')
         
+        # Throttled emotion classifier, None for the brightness heuristic
+        if emotion_model not in EMOTION_MODELS:
+            raise ValueError(f"Unknown emotion model '{emotion_model}', expected one of {EMOTION_MODELS}")
+        self.emotion_stage = None
+        if emotion_model == 'deepface':
+            self.emotion_stage = EmotionStage()
+            if emotion_batch_size > 1:
+                batcher = get_emotion_batcher(max_batch=emotion_batch_size, max_wait=emotion_batch_wait)
+                self.emotion_stage.classifier = batcher.classify
+        
         # Eye tracking variables
         self.eye_history = []
         self.gaze_direction_history = []
+        
+        # Smoothed gaze state and debounced gaze events of the session
+        self.gaze_tracker = GazeStateTracker(look_away_seconds=look_away_seconds)
+        self.initial_gaze_state = self.gaze_tracker.state_dict()
+        
+        # Unchanged frames are answered with a copy of the last analysis
+        self.change_gate = FrameChangeGate(**(change_gate_options or {})) if skip_unchanged else None
+        self.last_analysis = None
+        
+        # Face tracking state
+        self.track_faces = track_faces
+        self.redetect_interval = redetect_interval
+        self.track_margin = track_margin
+        self.last_face = None
+        self.frames_since_detection = 0
+        
+        # Detection resolution (None = native resolution)
+        self.detection_width = detection_width
+        self.eye_roi_width = eye_roi_width
+        
+        # Seconds per analysis stage of the frame being analyzed, and what
+        # stages did for it ('face_search': 'tracked' or 'full', 'emotion':
+        # 'cached', 'classified' or 'failed', 'change_gate': 'unchanged' or 'changed')
+        self.stage_seconds: Dict[str, float] = {}
+        self.stage_outcomes: Dict[str, str] = {}
+        
+        # Frames saved synchronously by this processor, used for unique file names
+        self.frames_saved = 0
+        
+        # Serialises analysis of this processor when frames run on worker threads
+        self.lock = threading.Lock()
+        # Set by close; analyses still in flight are then no longer recorded
+        self.closed = False
     
-    def convert_numpy_types(self, obj):
-        """
-        Convert NumPy types to native Python types for JSON serialization
-        """
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, np.bool_):
-            return bool(obj)
-        elif isinstance(obj, dict):
-            return {key: self.convert_numpy_types(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self.convert_numpy_types(item) for item in obj]
-        elif isinstance(obj, tuple):
-            return tuple(self.convert_numpy_types(item) for item in obj)
-        else:
-            return obj
+    @contextmanager
+    def timed(self, stage: str):
+        """
+        Add the time spent in the block to the current frame's stage timings
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + time.perf_counter() - start
+    
+    def attach_stage_stats(self, analysis: Dict) -> Dict:
+        """
+        Move the current frame's stage timings and outcomes onto its analysis
+        
+        They are attached under STAGE_TIMINGS_KEY and STAGE_OUTCOMES_KEY;
+        record_analysis or AnalysisMetrics.observe_analysis removes them.
+        """
+        analysis[STAGE_TIMINGS_KEY], self.stage_seconds = self.stage_seconds, {}
+        analysis[STAGE_OUTCOMES_KEY], self.stage_outcomes = self.stage_outcomes, {}
+        return analysis
+    
+    def base64_to_bytes(self, base64_string: str) -> bytes:
+        """
+        Decode a base64 image, with or without data URL prefix, to its encoded bytes
+        """
+        # Remove data URL prefix if present
+        base64_string = base64_string[base64_string.find(',') + 1:]
+        return base64.b64decode(base64_string)
     
     def base64_to_frame(self, base64_string: str) -> Optional[np.ndarray]:
         """
         Convert base64 string to OpenCV frame
         """
         try:
-            # Remove data URL prefix if present
-            if ',' in base64_string:
-                base64_string = base64_string.split(',')[1]
-            
-            # Decode base64
-            image_data = base64.b64decode(base64_string)
+            return self.bytes_to_frame(self.base64_to_bytes(base64_string))
+        except Exception as e:
+            print(f"Error converting base64 to frame: {e}")
+            return None
+    
+    def bytes_to_frame(self, image_data) -> Optional[np.ndarray]:
+        """
+        Convert an encoded image buffer (JPEG, PNG) to OpenCV frame
+        
+        The buffer is wrapped with np.frombuffer, so cv2.imdecode reads the
+        request bytes directly without another copy.
+        """
+        try:
             nparr = np.frombuffer(image_data, np.uint8)
             frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             return frame
         except Exception as e:
-            print(f"Error converting base64 to frame: {e}")
+            print(f"Error converting bytes to frame: {e}")
             return None
     
     def frame_to_base64(self, frame: np.ndarray) -> str:
@@ -78,35 +203,76 @@ class SimpleVideoProcessor:
             print(f"Error converting frame to base64: {e}")
             return ""
     
-    def detect_faces(self, frame: np.ndarray) -> List[Dict]:
+    def detect_at_scale(self, cascade, gray: np.ndarray, scale: float, *args, **kwargs) -> np.ndarray:
         """
-        Detect faces in frame using OpenCV's Haar Cascade
+        Run a cascade on a resized copy of a grayscale image
+        """
+        return detect_at_scale(cascade, gray, scale, *args, **kwargs)
+    
+    def detect_faces(self, frame: Union[np.ndarray, FrameContext]) -> List[Dict]:
+        """
+        Detect faces in frame using the configured face detection backend
         """
         try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
-            
-            face_data = []
-            for (x, y, w, h) in faces:
-                face_data.append({
-                    'x': int(x),
-                    'y': int(y),
-                    'width': int(w),
-                    'height': int(h),
-                    'confidence': 0.8
-                })
-            
-            return face_data
+            return self.face_detector.detect(frame)
         except Exception as e:
             print(f"Error detecting faces: {e}")
             return []
     
-    def detect_eyes_improved(self, frame: np.ndarray, face_region: Dict = None) -> List[Dict]:
+    def detect_faces_in_region(self, frame: Union[np.ndarray, FrameContext], face: Dict) -> List[Dict]:
+        """
+        Detect faces only in an expanded region around a previous face box
+        """
+        try:
+            ctx = as_frame_context(frame)
+            frame_h, frame_w = ctx.shape[:2]
+            margin_x = int(face['width'] * self.track_margin)
+            margin_y = int(face['height'] * self.track_margin)
+            x0 = max(face['x'] - margin_x, 0)
+            y0 = max(face['y'] - margin_y, 0)
+            x1 = min(face['x'] + face['width'] + margin_x, frame_w)
+            y1 = min(face['y'] + face['height'] + margin_y, frame_h)
+            if x1 <= x0 or y1 <= y0:
+                return []
+            
+            # Only the face can have moved a little, so bound the search scale too
+            min_size = (int(face['width'] * 0.6), int(face['height'] * 0.6))
+            max_size = (int(face['width'] * 1.5), int(face['height'] * 1.5))
+            return self.face_detector.detect_in_region(ctx, (x0, y0, x1, y1), min_size, max_size)
+        except Exception as e:
+            print(f"Error tracking face: {e}")
+            return []
+    
+    def detect_faces_tracked(self, frame: Union[np.ndarray, FrameContext]) -> List[Dict]:
+        """
+        Detect faces, searching around the last primary face when possible
+        
+        Falls back to full-frame detection when the face is lost and every
+        redetect_interval frames, so new faces entering the frame are found.
+        """
+        ctx = as_frame_context(frame)
+        faces = []
+        if (self.track_faces and self.last_face is not None
+                and self.frames_since_detection < self.redetect_interval):
+            faces = self.detect_faces_in_region(ctx, self.last_face)
+        
+        if faces:
+            self.frames_since_detection += 1
+            self.stage_outcomes['face_search'] = 'tracked'
+        else:
+            faces = self.detect_faces(ctx)
+            self.frames_since_detection = 0
+            self.stage_outcomes['face_search'] = 'full'
+        
+        self.last_face = max(faces, key=lambda f: f['width'] * f['height']) if faces else None
+        return faces
+    
+    def detect_eyes_improved(self, frame: Union[np.ndarray, FrameContext], face_region: Dict = None) -> List[Dict]:
         """
         Improved eye detection using multiple methods
         """
         try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            gray = as_frame_context(frame).gray
             eyes = []
             
             if face_region:
@@ -114,40 +280,34 @@ class SimpleVideoProcessor:
                 x, y, w, h = face_region['x'], face_region['y'], face_region['width'], face_region['height']
                 roi_gray = gray[y:y+h, x:x+w]
                 
+                # Normalise the face size so eye detection cost does not depend on it
+                roi_scale = self.eye_roi_width / w if self.eye_roi_width and w > 0 else 1.0
+                
                 # Method 1: Standard eye cascade
-                eyes1 = self.eye_cascade.detectMultiScale(roi_gray, 1.1, 3, minSize=(20, 20))
+                with self.timed('eye_cascade'):
+                    eyes1 = self.detect_at_scale(self.eye_cascade, roi_gray, roi_scale, 1.1, 3, minSize=(20, 20))
                 
                 # Method 2: Eye pair cascade (for glasses)
-                eyes2 = self.eye_pair_cascade.detectMultiScale(roi_gray, 1.1, 3, minSize=(30, 15))
+                with self.timed('eye_pair_cascade'):
+                    eyes2 = self.detect_at_scale(self.eye_pair_cascade, roi_gray, roi_scale, 1.1, 3, minSize=(30, 15))
                 
-                # Combine results
-                all_eyes = list(eyes1) + list(eyes2)
+                # Combine results, standard cascade first so its boxes win duplicates
+                all_eyes = np.concatenate((eyes1, eyes2)).reshape(-1, 4)
+                all_eyes = all_eyes[suppress_duplicate_boxes(all_eyes, min_distance=30)]
                 
-                # Convert coordinates back to full frame and deduplicate
+                # Convert coordinates back to full frame
+                centers = box_centers(all_eyes) + (x, y)
                 eye_data = []
-                for (ex, ey, ew, eh) in all_eyes:
-                    eye_center_x = x + ex + ew/2
-                    eye_center_y = y + ey + eh/2
-                    
-                    # Check if this eye is too close to existing eyes (deduplication)
-                    is_duplicate = False
-                    for existing_eye in eye_data:
-                        distance = np.sqrt((eye_center_x - existing_eye['center_x'])**2 + 
-                                         (eye_center_y - existing_eye['center_y'])**2)
-                        if distance < 30:  # Too close, likely duplicate
-                            is_duplicate = True
-                            break
-                    
-                    if not is_duplicate:
-                        eye_data.append({
-                            'x': int(x + ex),
-                            'y': int(y + ey),
-                            'width': int(ew),
-                            'height': int(eh),
-                            'center_x': int(eye_center_x),
-                            'center_y': int(eye_center_y),
-                            'confidence': 0.8
-                        })
+                for (ex, ey, ew, eh), (eye_center_x, eye_center_y) in zip(all_eyes.tolist(), centers.tolist()):
+                    eye_data.append({
+                        'x': int(x + ex),
+                        'y': int(y + ey),
+                        'width': int(ew),
+                        'height': int(eh),
+                        'center_x': int(eye_center_x),
+                        'center_y': int(eye_center_y),
+                        'confidence': 0.8
+                    })
                 
                 # Sort eyes by x position (left to right)
                 eye_data.sort(key=lambda e: e['center_x'])
@@ -213,7 +373,7 @@ class SimpleVideoProcessor:
                 # Calculate eye line angle
                 eye_dx = right_eye['center_x'] - left_eye['center_x']
                 eye_dy = right_eye['center_y'] - left_eye['center_y']
-                eye_angle = np.arctan2(eye_dy, eye_dx) * 180 / np.pi
+                eye_angle = math.degrees(math.atan2(eye_dy, eye_dx))
                 
             else:
                 # Use single eye
@@ -299,13 +459,11 @@ class SimpleVideoProcessor:
         Improved screen looking detection
         """
         # Calculate distance from frame center
-        distance_from_center = np.sqrt(
-            (eye_x - frame_center_x)**2 + (eye_y - frame_center_y)**2
-        )
+        distance_from_center = math.hypot(eye_x - frame_center_x, eye_y - frame_center_y)
         
         # Calculate face size relative to frame
-        frame_diagonal = np.sqrt(frame_center_x**2 + frame_center_y**2)
-        face_size = np.sqrt((face_x - frame_center_x)**2 + (face_y - frame_center_y)**2)
+        frame_diagonal = math.hypot(frame_center_x, frame_center_y)
+        face_size = math.hypot(face_x - frame_center_x, face_y - frame_center_y)
         
         # Dynamic acceptable distance based on face size
         if face_size < frame_diagonal * 0.1:  # Small face (far from camera)
@@ -320,20 +478,20 @@ class SimpleVideoProcessor:
         Enhanced frame analysis with improved eye detection
         """
         try:
+            # Grayscale and channel statistics are shared by all stages
+            ctx = FrameContext(frame)
+            with self.timed('grayscale'):
+                ctx.gray  # Converted here so detection timings do not include it
+            
             # Detect faces
-            faces = self.detect_faces(frame)
+            with self.timed('face_detection'):
+                faces = self.detect_faces_tracked(ctx)
             
             # Simple brightness analysis
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            brightness = float(np.mean(gray))
+            brightness = ctx.brightness
             
             # Simple color analysis
-            b, g, r = cv2.split(frame)
-            avg_color = {
-                'blue': float(np.mean(b)),
-                'green': float(np.mean(g)),
-                'red': float(np.mean(r))
-            }
+            avg_color = dict(ctx.channel_means)
             
             # Enhanced eye detection and gaze analysis
             eye_analysis = {
@@ -345,13 +503,14 @@ class SimpleVideoProcessor:
             if faces:
                 # Detect eyes in the first (largest) face
                 primary_face = max(faces, key=lambda f: f['width'] * f['height'])
-                eyes = self.detect_eyes_improved(frame, primary_face)
+                eyes = self.detect_eyes_improved(ctx, primary_face)
                 eye_analysis['eyes_detected'] = len(eyes)
                 eye_analysis['eye_data'] = eyes
                 
                 # Analyze gaze direction
                 if eyes:
-                    gaze_analysis = self.analyze_gaze_direction_improved(eyes, primary_face, frame.shape)
+                    with self.timed('gaze'):
+                        gaze_analysis = self.analyze_gaze_direction_improved(eyes, primary_face, frame.shape)
                     eye_analysis['gaze_analysis'] = gaze_analysis
                 else:
                     # No eyes detected, but face is present
@@ -362,8 +521,23 @@ class SimpleVideoProcessor:
                         'reason': 'eyes_not_detected_in_face'
                     }
             
-            # Estimate emotion based on simple heuristics
-            estimated_emotion = self.estimate_emotion_simple(frame, faces, brightness)
+            # Classify the primary face when a model is configured, otherwise
+            # estimate emotion based on simple heuristics
+            emotion_analysis = None
+            if self.emotion_stage is not None:
+                if faces:
+                    with self.timed('emotion'):
+                        emotion_analysis = self.emotion_stage.analyze(ctx, primary_face)
+                    if emotion_analysis is None:
+                        self.stage_outcomes['emotion'] = 'failed'
+                    else:
+                        self.stage_outcomes['emotion'] = 'cached' if emotion_analysis['cached'] else 'classified'
+                else:
+                    self.emotion_stage.reset()
+            if emotion_analysis is not None:
+                estimated_emotion = emotion_analysis['dominant_emotion']
+            else:
+                estimated_emotion = self.estimate_emotion_simple(frame, faces, brightness)
             
             result = {
                 'timestamp': datetime.now().isoformat(),
@@ -375,9 +549,12 @@ class SimpleVideoProcessor:
                 'frame_quality': 'good' if len(faces) > 0 else 'no_face_detected',
                 'eye_analysis': eye_analysis
             }
+            if self.emotion_stage is not None:
+                result['emotion_analysis'] = emotion_analysis
             
-            # Convert all NumPy types to native Python types
-            return self.convert_numpy_types(result)
+            # Every stage already returns native Python types, so the result
+            # is JSON serialisable as built
+            return result
             
         except Exception as e:
             return {
@@ -419,26 +596,187 @@ class SimpleVideoProcessor:
             print(f"Error saving frame: {e}")
             return ""
     
-    def process_frame_from_base64(self, base64_data: str, save_frame: bool = False) -> Dict:
+    def save_encoded_frame(self, image_data: bytes, filename: str) -> str:
         """
-        Process a single frame from base64 data
+        Save already encoded image bytes to file without re-encoding them
+        """
+        try:
+            filepath = os.path.join(self.output_dir, filename)
+            with open(filepath, 'wb') as f:
+                f.write(image_data)
+            return filepath
+        except Exception as e:
+            print(f"Error saving frame: {e}")
+            return ""
+    
+    def next_frame_filename(self, extension: str = '.jpg') -> str:
+        """
+        Unique file name for a saved frame of this session
+        """
+        self.frames_saved += 1
+        return (f"frame_{self.session_id or 'local'}_{int(time.time() * 1000)}_"
+                f"{self.frames_saved:06d}{extension}")
+    
+    def analyze_base64_frame(self, base64_data: str, save_frame: bool = False) -> Dict:
+        """
+        Decode and analyze a single frame from base64 data without recording it
+        """
+        try:
+            with self.timed('decode'):
+                image_data = self.base64_to_bytes(base64_data)
+        except Exception as e:
+            print(f"Error converting base64 to frame: {e}")
+            # The decode time belongs to this frame, not the next one
+            return self.attach_stage_stats({'error': 'Could not decode frame'})
+        return self.analyze_encoded_frame(image_data, save_frame=save_frame)
+    
+    def analyze_encoded_frame(self, image_data: bytes, save_frame: bool = False) -> Dict:
+        """
+        Decode and analyze a single JPEG/PNG encoded frame without recording it
+        
+        Saved frames are written from image_data as sent, not re-encoded.
+        """
+        with self.timed('decode'):
+            frame = self.bytes_to_frame(image_data)
+        analysis = self.analyze_decoded_frame(frame)
+        if save_frame and 'timestamp' in analysis:
+            analysis['saved_frame'] = self.save_encoded_frame(image_data, self.next_frame_filename())
+        return analysis
+    
+    def analyze_decoded_frame(self, frame: Optional[np.ndarray], save_frame: bool = False) -> Dict:
+        """
+        Analyze a decoded frame and optionally save it to disk
+        
+        The stage timings and outcomes of the frame are attached, see
+        attach_stage_stats.
         """
-        frame = self.base64_to_frame(base64_data)
         if frame is None:
-            return {'error': 'Could not decode frame'}
+            analysis = {'error': 'Could not decode frame'}
+        else:
+            with self.timed('change_gate'):
+                unchanged = self.change_gate is not None and self.change_gate.is_unchanged(frame)
+            if self.change_gate is not None:
+                self.stage_outcomes['change_gate'] = 'unchanged' if unchanged else 'changed'
+            
+            if unchanged:
+                analysis = dict(self.last_analysis, timestamp=datetime.now().isoformat(),
+                                unchanged_frame=True)
+            else:
+                # Analyze frame
+                analysis = self.analyze_frame_simple(frame)
+                if self.change_gate is not None and 'error' in analysis:
+                    self.change_gate.reset()
+                    self.last_analysis = None
+                elif self.change_gate is not None:
+                    # Copied, because the returned analysis gets more keys added
+                    self.last_analysis = dict(analysis)
+            
+            # Save frame if requested
+            if save_frame:
+                analysis['saved_frame'] = self.save_frame(frame, self.next_frame_filename())
         
-        # Analyze frame
-        analysis = self.analyze_frame_simple(frame)
+        return self.attach_stage_stats(analysis)
+    
+    def warm_up(self, width: int = 640, height: int = 480) -> Dict:
+        """
+        Run a blank frame through the pipeline so the first real frame is not slower
         
-        # Save frame if requested
-        if save_frame:
-            timestamp = int(time.time())
-            filename = f"frame_{timestamp}.jpg"
-            filepath = self.save_frame(frame, filename)
-            analysis['saved_frame'] = filepath
+        Tracking state is reset afterwards, so the warm-up frame does not
+        count as a detection of the session.
+        """
+        start_time = time.time()
+        cascades = (self.eye_cascade, self.eye_pair_cascade)
+        ready = self.face_detector.ready and not any(cascade.empty() for cascade in cascades)
+        try:
+            self.analyze_decoded_frame(np.full((height, width, 3), 128, dtype=np.uint8))
+            if self.emotion_stage is not None:
+                # A blank frame has no face, so load the emotion model directly
+                self.emotion_stage.classifier(np.full((96, 96, 3), 128, dtype=np.uint8))
+        except Exception as e:
+            print(f"Error warming up processor: {e}")
+            ready = False
+        
+        self.last_face = None
+        self.frames_since_detection = 0
+        self.last_analysis = None
+        if self.change_gate is not None:
+            self.change_gate.reset()
+        return {'ready': ready, 'seconds': round(time.time() - start_time, 3)}
+    
+    def record_analysis(self, analysis: Dict, timestamp: Optional[str] = None):
+        """
+        Add a frame analysis to the history
+        
+        timestamp replaces the analysis time, for frames whose capture time is
+        known, e.g. frames of a batch. Also adds the frame to the session's counters in the store, feeds the
+        gaze tracker and adds its smoothed state ('gaze_state') and new events
+        ('gaze_events') to the analysis.
+        """
+        analysis.pop(STAGE_TIMINGS_KEY, None)
+        analysis.pop(STAGE_OUTCOMES_KEY, None)
+        if self.closed or ('error' in analysis and 'timestamp' not in analysis):
+            return
+        if timestamp is not None:
+            analysis['timestamp'] = timestamp
+        
+        update_gaze = partial(self._update_gaze, analysis) if 'error' not in analysis else None
+        self.store.record(self.store_key, frame_counters(analysis), analysis['timestamp'], update_gaze)
+        if self.analysis_store is not None:
+            self.analysis_store.submit(self.store_key, analysis)
+        
+        self.history.append(analysis)
+        if self.log is not None:
+            self.log.append(analysis)
+    
+    def _update_gaze(self, analysis: Dict, state: Optional[Dict]) -> Dict:
+        """
+        Feed an analysis to the gaze tracker, given the session's stored gaze state
+
+        Adds the smoothed state and new events to the analysis and returns
+        the tracker state to store.
+        """
+        # Another worker may have recorded frames of the session since;
+        # loading the state also makes retried updates repeatable
+        if self.store.shared:
+            self.gaze_tracker.load_state(state or self.initial_gaze_state)
+        gaze = self.gaze_tracker.update(analysis)
+        analysis['gaze_state'] = gaze['state']
+        analysis['gaze_events'] = gaze['events']
+        return self.gaze_tracker.state_dict()
+    
+    def finalize_log(self) -> Optional[str]:
+        """
+        Close the current session log file, writing the summary next to it
+        
+        Later analyses go to a new log file. Returns the closed file path,
+        or None if nothing has been logged since the last call.
+        """
+        if self.log is None:
+            return None
+        return self.log.rotate(self.get_analysis_summary())
+    
+    def close(self):
+        """
+        Release resources held for the session
+
+        Waits for an analysis holding the processor lock; frames recorded
+        after this are ignored, so they cannot reopen the session log.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.finalize_log()
+            self.face_detector.close()
+    
+    def process_frame_from_base64(self, base64_data: str, save_frame: bool = False) -> Dict:
+        """
+        Process a single frame from base64 data
+        """
+        analysis = self.analyze_base64_frame(base64_data, save_frame=save_frame)
         
         # Add to history
-        self.emotion_history.append(analysis)
+        self.record_analysis(analysis)
         
         return analysis
     
@@ -446,47 +784,15 @@ class SimpleVideoProcessor:
         """
         Get summary of all analyses including eye tracking
         """
-        if not self.emotion_history:
+        aggregates = self.store.aggregates(self.store_key)
+        if aggregates is None:
             return {'message': 'No analysis data available'}
-        
-        total_frames = len(self.emotion_history)
-        total_faces = sum(analysis.get('faces_detected', 0) for analysis in self.emotion_history)
-        total_eyes = sum(analysis.get('eye_analysis', {}).get('eyes_detected', 0) for analysis in self.emotion_history)
-        
-        # Count emotions and gaze directions
-        emotion_counts = {}
-        gaze_directions = {}
-        looking_at_screen_count = 0
-        
-        for analysis in self.emotion_history:
-            emotion = analysis.get('estimated_emotion', 'unknown')
-            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
-            
-            # Eye tracking statistics
-            gaze_analysis = analysis.get('eye_analysis', {}).get('gaze_analysis')
-            if gaze_analysis:
-                gaze_dir = gaze_analysis.get('gaze_direction', 'unknown')
-                gaze_directions[gaze_dir] = gaze_directions.get(gaze_dir, 0) + 1
-                
-                if gaze_analysis.get('is_looking_at_screen', False):
-                    looking_at_screen_count += 1
-        
-        summary = {
-            'total_frames_analyzed': total_frames,
-            'total_faces_detected': total_faces,
-            'total_eyes_detected': total_eyes,
-            'emotion_distribution': emotion_counts,
-            'gaze_direction_distribution': gaze_directions,
-            'looking_at_screen_percentage': float(looking_at_screen_count / total_frames * 100) if total_frames > 0 else 0.0,
-            'average_brightness': float(np.mean([a.get('brightness', 0) for a in self.emotion_history])),
-            'analysis_period': {
-                'start': self.emotion_history[0]['timestamp'] if self.emotion_history else None,
-                'end': self.emotion_history[-1]['timestamp'] if self.emotion_history else None
-            }
-        }
-        
-        # Convert all NumPy types to native Python types
-        return self.convert_numpy_types(summary)
+        counters = aggregates['counters']
+        summary = summarize_counters(counters, aggregates['first_timestamp'], aggregates['last_timestamp'])
+        if counters.get('frames'):
+            summary['gaze_events'] = dict((aggregates['state'] or {}).get('event_counts', {}))
+            summary['unchanged_frames'] = int(counters.get('unchanged', 0))
+        return summary
     
     def save_analysis_to_file(self, filename: str = None) -> str:
         """
@@ -499,7 +805,7 @@ class SimpleVideoProcessor:
         
         data = {
             'summary': self.get_analysis_summary(),
-            'detailed_analysis': self.emotion_history,
+            'detailed_analysis': self.history.to_dicts(),
             'exported_at': datetime.now().isoformat()
         }
         
@@ -1,11 +1,25 @@
 class VideoAnalyzer {
     constructor() {
         this.isAnalyzing = false;
-        this.analysisInterval = null;
+        this.analysisTimer = null;
         this.apiBaseUrl = 'http://localhost:8003/api';
+        this.sessionId = null;
+        this.socket = null;
+        this.streamFps = 4;  // Frame rate when streaming over WebSocket
+        // Pacing, updated from the server's hint after every frame
+        this.requestedIntervalMs = 2000;  // Interval asked for by startAnalysis
+        this.baseIntervalMs = 2000;  // Shortest interval right now, the hint can only lengthen it
+        this.frameIntervalMs = 2000;
+        this.maxFrameIntervalMs = 5000;
+        this.jpegQuality = 0.8;
+        this.maxFrameWidth = null;
+        this.resultTimeoutMs = 5000;  // Give up waiting for a streamed result after this
+        this.pendingResult = null;  // {frame, resolve} of the streamed frame awaiting its result
+        this.streamFrameCount = 0;  // Frames sent on the current socket, as numbered by the server
         this.frameCount = 0;
         this.expressionHistory = [];
-        this.eyeTrackingHistory = [];
+        this.gazeState = null;  // Smoothed by the server over the session's frames
+        this.gazeEvents = [];   // Recent debounced gaze events from the server
     }
 
     async startAnalysis(intervalSeconds = 2) {
@@ -24,31 +38,195 @@ class VideoAnalyzer {
         this.isAnalyzing = true;
         console.log('Starting enhanced video analysis with eye tracking...');
 
+        // Each rehearsal gets its own server-side session
+        await this.startSession();
+
+        // Stream frames over a WebSocket when possible, otherwise post them.
+        // The faster stream rate only applies while the socket is open
+        this.requestedIntervalMs = intervalSeconds * 1000;
+        this.setBaseInterval(this.requestedIntervalMs);
+        if (this.sessionId && 'WebSocket' in window) {
+            this.openStream();
+        }
+
         // Create canvas to capture frames
         const canvas = document.createElement('canvas');
         const ctx = canvas.getContext('2d');
-        
-        this.analysisInterval = setInterval(async () => {
+
+        // Each frame is sent only after the previous result arrived, then the
+        // next one is scheduled using the server's pacing hint
+        const analyzeNextFrame = async () => {
+            const startedAt = performance.now();
             try {
-                // Set canvas size to match video
-                canvas.width = userVideo.videoWidth;
-                canvas.height = userVideo.videoHeight;
+                // Set canvas size to match video, scaled down if the server asks for it
+                const scale = this.maxFrameWidth && userVideo.videoWidth > this.maxFrameWidth
+                    ? this.maxFrameWidth / userVideo.videoWidth : 1;
+                canvas.width = Math.round(userVideo.videoWidth * scale);
+                canvas.height = Math.round(userVideo.videoHeight * scale);
                 
                 // Draw current video frame to canvas
                 ctx.drawImage(userVideo, 0, 0, canvas.width, canvas.height);
                 
-                // Convert to base64
-                const frameData = canvas.toDataURL('image/jpeg', 0.8);
+                // Encode as JPEG bytes
+                const frameBlob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', this.jpegQuality));
                 
-                // Send to API
-                await this.sendFrameForAnalysis(frameData);
-                
-                this.frameCount++;
+                // Send to API and wait for the result
+                if (frameBlob && this.isAnalyzing) {
+                    if (this.isStreaming()) {
+                        await this.sendStreamFrame(frameBlob);
+                    } else {
+                        await this.sendFrameForAnalysis(frameBlob);
+                    }
+                    this.frameCount++;
+                }
                 
             } catch (error) {
                 console.error('Error in frame analysis:', error);
             }
-        }, intervalSeconds * 1000);
+
+            if (this.isAnalyzing) {
+                const elapsed = performance.now() - startedAt;
+                this.analysisTimer = setTimeout(analyzeNextFrame, Math.max(this.frameIntervalMs - elapsed, 0));
+            }
+        };
+        analyzeNextFrame();
+    }
+
+    setBaseInterval(intervalMs) {
+        this.baseIntervalMs = intervalMs;
+        this.frameIntervalMs = intervalMs;
+    }
+
+    applyPacing(pacing) {
+        if (!pacing) {
+            return;
+        }
+        this.frameIntervalMs = Math.max(this.baseIntervalMs, pacing.next_interval_ms);
+        this.jpegQuality = pacing.jpeg_quality;
+        this.maxFrameWidth = pacing.max_width;
+    }
+
+    backOff() {
+        // The server is overloaded: slow down until a pacing hint says otherwise
+        this.frameIntervalMs = Math.min(this.frameIntervalMs * 2, this.maxFrameIntervalMs);
+    }
+
+    sendStreamFrame(frameBlob) {
+        // Resolved by the reply for this frame, or after a timeout. Replies
+        // carry the frame number, so a late reply to an earlier frame that
+        // timed out cannot resolve this one
+        const frame = ++this.streamFrameCount;
+        return new Promise(resolve => {
+            const timeout = setTimeout(() => {
+                this.pendingResult = null;
+                this.backOff();
+                resolve();
+            }, this.resultTimeoutMs);
+            this.pendingResult = {
+                frame,
+                resolve: () => {
+                    clearTimeout(timeout);
+                    this.pendingResult = null;
+                    resolve();
+                }
+            };
+            this.socket.send(frameBlob);
+        });
+    }
+
+    resolveStreamFrame(frame) {
+        // Returns false for a stale reply to a frame that already timed out
+        if (this.pendingResult && frame < this.pendingResult.frame) {
+            return false;
+        }
+        if (this.pendingResult) {
+            this.pendingResult.resolve();
+        }
+        return true;
+    }
+
+    async startSession() {
+        const previousSessionId = this.sessionId;
+        try {
+            const response = await fetch(`${this.apiBaseUrl}/sessions`, {
+                method: 'POST'
+            });
+            if (response.ok) {
+                const result = await response.json();
+                this.sessionId = result.session_id;
+                console.log('Analysis session started:', this.sessionId);
+            } else {
+                console.error('Could not start analysis session:', response.status);
+                this.sessionId = null;
+            }
+        } catch (error) {
+            console.error('Error starting analysis session:', error);
+            this.sessionId = null;
+        }
+
+        // Release the data of the previous rehearsal
+        if (previousSessionId && previousSessionId !== this.sessionId) {
+            fetch(`${this.apiBaseUrl}/sessions/${previousSessionId}`, {
+                method: 'DELETE'
+            }).catch(error => console.error('Error closing analysis session:', error));
+        }
+    }
+
+    openStream() {
+        const streamUrl = `${this.apiBaseUrl.replace(/^http/, 'ws')}/sessions/${encodeURIComponent(this.sessionId)}/stream?save_every=10`;
+        const socket = new WebSocket(streamUrl);
+        socket.binaryType = 'arraybuffer';
+        this.streamFrameCount = 0;
+
+        socket.onopen = () => {
+            if (this.socket === socket) {
+                this.setBaseInterval(Math.min(this.requestedIntervalMs, 1000 / this.streamFps));
+            }
+        };
+        socket.onmessage = (event) => {
+            const message = JSON.parse(event.data);
+            if (!this.resolveStreamFrame(message.frame)) {
+                return;
+            }
+            if (message.type === 'analysis') {
+                this.applyPacing(message.pacing);
+                this.generateExpressionSuggestion(message.result);
+                this.trackEyeGaze(message.result);
+            } else if (message.type === 'dropped') {
+                // The server had no room for the frame: slow down right away
+                this.applyPacing(message.pacing);
+                this.backOff();
+            }
+        };
+        socket.onerror = (error) => console.error('Analysis stream error:', error);
+        socket.onclose = () => {
+            if (this.socket === socket) {
+                this.socket = null;
+                // Posting falls back to the requested interval
+                this.setBaseInterval(this.requestedIntervalMs);
+            }
+            // Fall back to HTTP without waiting for the result timeout
+            if (this.pendingResult) {
+                this.pendingResult.resolve();
+            }
+        };
+
+        this.socket = socket;
+    }
+
+    isStreaming() {
+        return this.socket !== null && this.socket.readyState === WebSocket.OPEN;
+    }
+
+    closeStream() {
+        if (this.socket) {
+            this.socket.close();
+            this.socket = null;
+        }
+    }
+
+    sessionQuery() {
+        return this.sessionId ? `?session_id=${encodeURIComponent(this.sessionId)}` : '';
     }
 
     async stopAnalysis() {
@@ -57,16 +235,17 @@ class VideoAnalyzer {
         }
 
         this.isAnalyzing = false;
-        if (this.analysisInterval) {
-            clearInterval(this.analysisInterval);
-            this.analysisInterval = null;
+        if (this.analysisTimer) {
+            clearTimeout(this.analysisTimer);
+            this.analysisTimer = null;
         }
+        this.closeStream();
 
         console.log(`Analysis stopped. Processed ${this.frameCount} frames.`);
         
         // Save analysis data
         try {
-            const response = await fetch(`${this.apiBaseUrl}/save-analysis`, {
+            const response = await fetch(`${this.apiBaseUrl}/save-analysis${this.sessionQuery()}`, {
                 method: 'POST'
             });
             const result = await response.json();
@@ -76,25 +255,32 @@ class VideoAnalyzer {
         }
     }
 
-    async sendFrameForAnalysis(frameData) {
+    async sendFrameForAnalysis(frameBlob) {
         try {
-            const response = await fetch(`${this.apiBaseUrl}/analyze-frame`, {
+            const params = new URLSearchParams({
+                save_frame: this.frameCount % 10 === 0  // Save every 10th frame
+            });
+            if (this.sessionId) {
+                params.set('session_id', this.sessionId);
+            }
+
+            // Raw JPEG body, no base64 or JSON wrapping
+            const response = await fetch(`${this.apiBaseUrl}/analyze-frame/binary?${params}`, {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json',
+                    'Content-Type': 'image/jpeg',
                 },
-                body: JSON.stringify({
-                    frame_data: frameData,
-                    timestamp: new Date().toISOString(),
-                    save_frame: this.frameCount % 10 === 0  // Save every 10th frame
-                })
+                body: frameBlob
             });
 
             if (response.ok) {
                 const result = await response.json();
+                this.applyPacing(result.pacing);
                 // Removed displayAnalysisResult call - no more right side display
                 this.generateExpressionSuggestion(result);
                 this.trackEyeGaze(result);
+            } else if (response.status === 503) {
+                this.backOff();
             } else {
                 console.error('API request failed:', response.status);
             }
@@ -104,20 +290,15 @@ class VideoAnalyzer {
     }
 
     trackEyeGaze(analysis) {
-        const eyeAnalysis = analysis.eye_analysis || {};
-        const gazeAnalysis = eyeAnalysis.gaze_analysis;
-        
-        if (gazeAnalysis) {
-            this.eyeTrackingHistory.push({
-                timestamp: analysis.timestamp,
-                gaze_direction: gazeAnalysis.gaze_direction,
-                is_looking_at_screen: gazeAnalysis.is_looking_at_screen,
-                confidence: gazeAnalysis.confidence
-            });
-            
-            // Keep only last 10 entries
-            if (this.eyeTrackingHistory.length > 10) {
-                this.eyeTrackingHistory.shift();
+        // The server smooths gaze over the session and debounces events,
+        // so only its latest state and new events need to be kept
+        if (analysis.gaze_state) {
+            this.gazeState = analysis.gaze_state;
+        }
+        for (const event of analysis.gaze_events || []) {
+            this.gazeEvents.push(event);
+            if (this.gazeEvents.length > 10) {
+                this.gazeEvents.shift();
             }
         }
     }
@@ -151,11 +332,23 @@ class VideoAnalyzer {
             });
         }
         
-        // Eye tracking suggestions
+        // Debounced gaze events, e.g. looking away for several seconds
+        for (const event of analysis.gaze_events || []) {
+            if (event.type === 'looked_away') {
+                suggestions.push({
+                    type: 'warning',
+                    message: `👀 Looked away for ${Math.round(event.seconds)}s - Bring your eyes back to the screen`,
+                    priority: 'high'
+                });
+            }
+        }
+        
+        // Eye tracking suggestions, preferring the server's smoothed gaze state
         if (gazeAnalysis) {
+            const gazeState = analysis.gaze_state;
             const eyesDetected = eyeAnalysis.eyes_detected || 0;
-            const isLookingAtScreen = gazeAnalysis.is_looking_at_screen;
-            const gazeDirection = gazeAnalysis.gaze_direction;
+            const isLookingAtScreen = gazeState ? gazeState.is_looking_at_screen : gazeAnalysis.is_looking_at_screen;
+            const gazeDirection = gazeState ? gazeState.gaze_direction : gazeAnalysis.gaze_direction;
             
             if (eyesDetected === 0) {
                 suggestions.push({
@@ -198,7 +391,7 @@ class VideoAnalyzer {
         }
         
         // Expression suggestions based on context
-        const courtExpressions = this.getCourtExpressionSuggestions(emotion, faces, brightness, gazeAnalysis);
+        const courtExpressions = this.getCourtExpressionSuggestions(emotion, faces, brightness, analysis.gaze_state || gazeAnalysis);
         suggestions = suggestions.concat(courtExpressions);
         
         return suggestions;
@@ -254,12 +447,12 @@ class VideoAnalyzer {
         return suggestions;
     }
 
-    getCourtExpressionSuggestions(emotion, faces, brightness, gazeAnalysis) {
+    getCourtExpressionSuggestions(emotion, faces, brightness, gaze) {
         const suggestions = [];
         
         // Court-appropriate expression suggestions
         if (faces > 0 && brightness >= 80 && brightness <= 200) {
-            const isLookingAtScreen = gazeAnalysis?.is_looking_at_screen;
+            const isLookingAtScreen = gaze?.is_looking_at_screen;
             
             if (isLookingAtScreen) {
                 suggestions.push({
@@ -351,7 +544,7 @@ class VideoAnalyzer {
 
     async getAnalysisSummary() {
         try {
-            const response = await fetch(`${this.apiBaseUrl}/analysis-summary`);
+            const response = await fetch(`${this.apiBaseUrl}/analysis-summary${this.sessionQuery()}`);
             const summary = await response.json();
             console.log('Enhanced Analysis Summary:', summary);
             
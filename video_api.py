@@ -1,10 +1,75 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 import uvicorn
 from simple_video_processor import SimpleVideoProcessor
+from session_registry import SessionRegistry, SessionLimitError
+from session_store import SESSION_DB_PATH, create_session_store
+from analysis_store import ANALYSIS_DB_PATH, AnalysisStore
+from frame_executor import FrameExecutor, ExecutorSaturatedError
+from frame_writer import FrameWriter
+from emotion_batcher import emotion_batcher_status
+from metrics import AnalysisMetrics
+from session_log import dumps_line
+from video_file_analyzer import VideoAnalysisJob
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class AnalysisJSONResponse(JSONResponse):
+    """
+    JSON response encoded with orjson when it is installed
+
+    Analysis endpoints return this directly, so results skip FastAPI's
+    jsonable_encoder copy; their response_model only documents the schema.
+    """
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+        return super().render(content)
+
+async def warm_up_workers():
+    """
+    Load models in every analysis worker and mark the API ready when done
+    """
+    try:
+        result = await executor.warm_up()
+        readiness['ready'] = result['ready']
+        readiness['warmup_seconds'] = result['seconds']
+        if not result['ready']:
+            readiness['error'] = "Detection models failed to load"
+    except Exception as e:
+        print(f"Error warming up analysis workers: {e}")
+        readiness['error'] = str(e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so the port opens at once; /api/ready
+    # reports 503 until the workers are warm
+    warm_up_task = asyncio.create_task(warm_up_workers()) if WARMUP else None
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    executor.shutdown()
+    frame_writer.close()
+    sessions.shutdown()
+    sessions.store.close()
+    if analysis_store is not None:
+        analysis_store.close()
 
-app = FastAPI(title="Simple Video Analysis API", version="1.0.0")
+app = FastAPI(title="Simple Video Analysis API", version="1.0.0", lifespan=lifespan,
+              default_response_class=AnalysisJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -15,50 +80,704 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize processor
-processor = SimpleVideoProcessor()
+# Session settings
+MAX_SESSIONS = int(os.environ.get("VIDEO_API_MAX_SESSIONS", "64"))
+SESSION_IDLE_TIMEOUT = float(os.environ.get("VIDEO_API_SESSION_IDLE_TIMEOUT", "600"))
+HISTORY_CAPACITY = int(os.environ.get("VIDEO_API_HISTORY_CAPACITY", "3600"))
+
+# API worker processes. Several workers need a session store they all see:
+# sqlite for one host (the default then) or redis across hosts
+SERVER_WORKERS = int(os.environ.get("VIDEO_API_SERVER_WORKERS", "1"))
+SESSION_STORE = os.environ.get("VIDEO_API_SESSION_STORE", "sqlite" if SERVER_WORKERS > 1 else "memory")
+SESSION_STORE_OPTIONS = {}
+if SESSION_STORE == "sqlite":
+    SESSION_STORE_OPTIONS = {"path": os.environ.get("VIDEO_API_SESSION_DB", SESSION_DB_PATH)}
+elif SESSION_STORE == "redis":
+    SESSION_STORE_OPTIONS = {"url": os.environ.get("VIDEO_API_REDIS_URL", "redis://localhost:6379/0")}
+
+if __name__ == "__main__" and SERVER_WORKERS > 1:
+    # Every worker process imports the app itself. This process only
+    # supervises them, so it stops before building executors, stores and
+    # their background threads
+    uvicorn.run("video_api:app", host="0.0.0.0", port=8003, workers=SERVER_WORKERS)
+    raise SystemExit
+
+# Detection settings
+TRACK_FACES = os.environ.get("VIDEO_API_TRACK_FACES", "1") == "1"
+DETECTION_WIDTH = int(os.environ.get("VIDEO_API_DETECTION_WIDTH", "0")) or None
+EYE_ROI_WIDTH = int(os.environ.get("VIDEO_API_EYE_ROI_WIDTH", "0")) or None
+
+# Face detection backend: haar, mediapipe or dnn (OpenCV res10 SSD)
+FACE_DETECTOR = os.environ.get("VIDEO_API_FACE_DETECTOR", "haar")
+FACE_DETECTOR_OPTIONS = {}
+if FACE_DETECTOR == "dnn":
+    FACE_DETECTOR_OPTIONS = {
+        "model_path": os.environ.get("VIDEO_API_DNN_MODEL") or None,
+        "config_path": os.environ.get("VIDEO_API_DNN_CONFIG") or None,
+        "min_confidence": float(os.environ.get("VIDEO_API_DNN_CONFIDENCE", "0.5")),
+    }
+
+# Emotion: heuristic (brightness) or deepface (throttled, primary face only)
+EMOTION_MODEL = os.environ.get("VIDEO_API_EMOTION_MODEL", "heuristic")
+# Faces of concurrent frames classified in one DeepFace batch (0 = no batching)
+EMOTION_BATCH_SIZE = int(os.environ.get("VIDEO_API_EMOTION_BATCH_SIZE", "0"))
+EMOTION_BATCH_WAIT_MS = float(os.environ.get("VIDEO_API_EMOTION_BATCH_WAIT_MS", "5"))
+
+# Seconds of looking away before a session emits a 'looked_away' gaze event
+LOOK_AWAY_SECONDS = float(os.environ.get("VIDEO_API_LOOK_AWAY_SECONDS", "3"))
+
+# Frames that look the same as the session's last analyzed frame reuse its analysis
+SKIP_UNCHANGED = os.environ.get("VIDEO_API_SKIP_UNCHANGED", "1") == "1"
+CHANGE_GATE_OPTIONS = {
+    "pixel_threshold": int(os.environ.get("VIDEO_API_UNCHANGED_PIXEL_THRESHOLD", "16")),
+    "max_changed_fraction": float(os.environ.get("VIDEO_API_UNCHANGED_MAX_FRACTION", "0.01")),
+    "max_age": float(os.environ.get("VIDEO_API_UNCHANGED_MAX_AGE_MS", "1000")) / 1000,
+}
+
+# Per-session JSON Lines logs
+SESSION_LOG = os.environ.get("VIDEO_API_SESSION_LOG", "1") == "1"
+SESSION_LOG_COMPRESS = os.environ.get("VIDEO_API_SESSION_LOG_COMPRESS", "0") == "1"
+
+# Execution settings: inline, thread or process
+EXECUTOR_MODE = os.environ.get("VIDEO_API_EXECUTOR", "thread")
+# Analysis workers per API worker; by default the cores are split between API workers
+EXECUTOR_WORKERS = int(os.environ.get("VIDEO_API_WORKERS", "0")) or None
+if EXECUTOR_WORKERS is None and SERVER_WORKERS > 1:
+    EXECUTOR_WORKERS = max((os.cpu_count() or 1) // SERVER_WORKERS, 1)
+EXECUTOR_MAX_PENDING = int(os.environ.get("VIDEO_API_MAX_PENDING", "0")) or None
+MAX_BATCH_FRAMES = int(os.environ.get("VIDEO_API_MAX_BATCH_FRAMES", "64"))
+# Process mode: frames up to this size reach the workers through shared memory, 0 pickles them
+FRAME_SLOT_KB = int(os.environ.get("VIDEO_API_FRAME_SLOT_KB", "1024"))
+
+# Run a blank frame through every worker at startup
+WARMUP = os.environ.get("VIDEO_API_WARMUP", "1") == "1"
+
+# Client pacing hints: frame interval bounds and the load at which
+# clients are asked to send smaller, lower quality frames
+MIN_FRAME_INTERVAL_MS = int(os.environ.get("VIDEO_API_MIN_FRAME_INTERVAL_MS", "250"))
+MAX_FRAME_INTERVAL_MS = int(os.environ.get("VIDEO_API_MAX_FRAME_INTERVAL_MS", "5000"))
+REDUCED_QUALITY_LOAD = float(os.environ.get("VIDEO_API_REDUCED_QUALITY_LOAD", "0.5"))
+
+# Sampled frames are written to disk in the background
+SAVE_FRAME_QUEUE = int(os.environ.get("VIDEO_API_SAVE_FRAME_QUEUE", "64"))
+SAVE_FRAME_QUOTA_MB = int(os.environ.get("VIDEO_API_SAVE_FRAME_QUOTA_MB", "512"))
+SAVED_FRAME_DIR = os.path.join("video_analysis_output", "frames")
+
+# Every recorded frame is also stored in an indexed SQLite database for queries
+ANALYSIS_STORE = os.environ.get("VIDEO_API_ANALYSIS_STORE", "1") == "1"
+ANALYSIS_DB = os.environ.get("VIDEO_API_ANALYSIS_DB", ANALYSIS_DB_PATH)
+MAX_QUERY_ROWS = int(os.environ.get("VIDEO_API_MAX_QUERY_ROWS", "10000"))
+
+# Recorded video jobs
+MAX_VIDEO_JOBS = int(os.environ.get("VIDEO_API_MAX_VIDEO_JOBS", "2"))
+VIDEO_JOB_WORKERS = int(os.environ.get("VIDEO_API_VIDEO_JOB_WORKERS", "0")) or None
+VIDEO_UPLOAD_DIR = os.path.join("video_analysis_output", "uploads")
+# Finished jobs are forgotten after this many seconds, or when more than
+# MAX_FINISHED_VIDEO_JOBS have piled up; their JSONL output stays on disk
+VIDEO_JOB_TTL = float(os.environ.get("VIDEO_API_VIDEO_JOB_TTL", "3600"))
+MAX_FINISHED_VIDEO_JOBS = int(os.environ.get("VIDEO_API_MAX_FINISHED_VIDEO_JOBS", "100"))
+
+# Frames sent without a session id are analysed in this shared session
+DEFAULT_SESSION_ID = "default"
+
+processor_factory = partial(SimpleVideoProcessor, history_capacity=HISTORY_CAPACITY,
+                            track_faces=TRACK_FACES, detection_width=DETECTION_WIDTH,
+                            eye_roi_width=EYE_ROI_WIDTH, stream_log=SESSION_LOG,
+                            log_compress=SESSION_LOG_COMPRESS, face_detector=FACE_DETECTOR,
+                            face_detector_options=FACE_DETECTOR_OPTIONS,
+                            emotion_model=EMOTION_MODEL, emotion_batch_size=EMOTION_BATCH_SIZE,
+                            emotion_batch_wait=EMOTION_BATCH_WAIT_MS / 1000,
+                            look_away_seconds=LOOK_AWAY_SECONDS, skip_unchanged=SKIP_UNCHANGED,
+                            change_gate_options=CHANGE_GATE_OPTIONS)
+
+# Batches recorded frames into the analysis database
+analysis_store = AnalysisStore(ANALYSIS_DB) if ANALYSIS_STORE else None
+
+# One processor per rehearsal session and API worker. Only session processors
+# write to the analysis store; pool workers get the plain factory
+sessions = SessionRegistry(
+    processor_factory=partial(processor_factory, analysis_store=analysis_store),
+    max_sessions=MAX_SESSIONS,
+    idle_timeout=SESSION_IDLE_TIMEOUT,
+    store=create_session_store(SESSION_STORE, **SESSION_STORE_OPTIONS),
+)
+
+# Counters and stage timings exposed on /metrics
+metrics = AnalysisMetrics()
+queue_depth = metrics.registry.gauge('video_executor_pending_frames', 'Frames submitted and not yet analyzed')
+queue_limit = metrics.registry.gauge('video_executor_max_pending_frames', 'Pending frames before new ones are rejected')
+frames_per_second = metrics.registry.gauge('video_frames_per_second', 'Frames analyzed per second over the last 10 seconds')
+active_sessions = metrics.registry.gauge('video_active_sessions', 'Open analysis sessions')
+writer_queue = metrics.registry.gauge('video_frame_writer_queued_frames', 'Saved frames waiting to be written')
+writer_dropped = metrics.registry.gauge('video_frame_writer_dropped_frames', 'Frames the writer dropped')
+
+# Frame analysis runs off the event loop
+executor = FrameExecutor(
+    mode=EXECUTOR_MODE,
+    max_workers=EXECUTOR_WORKERS,
+    max_pending=EXECUTOR_MAX_PENDING,
+    processor_factory=processor_factory,
+    metrics=metrics,
+    share_frames=FRAME_SLOT_KB > 0,
+    frame_slot_bytes=FRAME_SLOT_KB * 1024,
+)
+
+# Writes sampled frames without blocking analysis
+frame_writer = FrameWriter(
+    output_dir=SAVED_FRAME_DIR,
+    max_queue=SAVE_FRAME_QUEUE,
+    quota_bytes=SAVE_FRAME_QUOTA_MB * 1024 * 1024,
+)
+
+# Startup warm-up state reported by /api/status and /api/ready
+readiness = {'ready': not WARMUP, 'warmup_seconds': None, 'error': None}
+
+# Recorded video analysis jobs by job id
+video_jobs = {}
 
 class FrameData(BaseModel):
     frame_data: str  # Base64 encoded image
     timestamp: str
     save_frame: bool = False
+    session_id: Optional[str] = None
+
+class BatchFrame(BaseModel):
+    frame_data: str  # Base64 encoded image
+    timestamp: Optional[datetime] = None  # Capture time, defaults to the analysis time
+    save_frame: bool = False
+
+class BatchRequest(BaseModel):
+    frames: List[BatchFrame]
+    session_id: Optional[str] = None
 
 class AnalysisRequest(BaseModel):
     duration: int = 10
     save_frames: bool = True
 
-@app.post("/api/analyze-frame")
+class SessionRequest(BaseModel):
+    session_id: Optional[str] = None
+
+class FaceBox(BaseModel):
+    x: int
+    y: int
+    width: int
+    height: int
+    confidence: float
+
+class EyeBox(FaceBox):
+    center_x: int
+    center_y: int
+
+class EyePositions(BaseModel):
+    eyes_detected: int
+    eye_line_center: Tuple[float, float]
+    eye_angle: float
+
+class GazeAnalysis(BaseModel):
+    gaze_direction: str
+    confidence: float
+    is_looking_at_screen: bool
+    eye_positions: Optional[EyePositions] = None
+    frame_center: Optional[Tuple[float, float]] = None
+    face_center: Optional[Tuple[float, float]] = None
+    reason: Optional[str] = None
+
+class EyeAnalysis(BaseModel):
+    eyes_detected: int
+    eye_data: List[EyeBox]
+    gaze_analysis: Optional[GazeAnalysis] = None
+
+class EmotionAnalysis(BaseModel):
+    dominant_emotion: str
+    confidence: float
+    emotions: Dict[str, float]
+    cached: bool
+
+class GazeState(BaseModel):
+    state: str  # looking, away or no_face
+    state_seconds: float
+    looking_score: float
+    is_looking_at_screen: bool
+    gaze_direction: str
+
+class GazeEvent(BaseModel):
+    type: str  # looked_away, looked_back, face_lost or face_found
+    at: str
+    seconds: float
+
+class PacingHint(BaseModel):
+    next_interval_ms: int
+    jpeg_quality: float
+    max_width: Optional[int] = None
+
+class FrameAnalysis(BaseModel):
+    timestamp: Optional[str] = None  # Missing when the frame could not be decoded
+    faces_detected: int = 0
+    face_data: List[FaceBox] = []
+    brightness: Optional[float] = None
+    avg_color: Optional[Dict[str, float]] = None
+    estimated_emotion: Optional[str] = None
+    frame_quality: Optional[str] = None
+    eye_analysis: Optional[EyeAnalysis] = None
+    emotion_analysis: Optional[EmotionAnalysis] = None  # Only with VIDEO_API_EMOTION_MODEL=deepface
+    gaze_state: Optional[GazeState] = None  # Smoothed over the session's frames
+    gaze_events: List[GazeEvent] = []
+    unchanged_frame: bool = False  # Copied from the last analysis, the frame had not changed
+    saved_frame: Optional[str] = None
+    pacing: Optional[PacingHint] = None
+    error: Optional[str] = None
+
+class BatchAnalysis(BaseModel):
+    frames_analyzed: int
+    results: List[FrameAnalysis]
+
+async def run_session_call(fn, *args, **kwargs):
+    """
+    Run a call that may reach the session store, on a thread when the store is shared
+
+    Shared stores can wait for a database lock or a Redis round trip, which
+    must not hold up the event loop; the in-memory store answers at once.
+    """
+    if sessions.store.shared:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+async def get_session_processor(session_id: Optional[str]) -> SimpleVideoProcessor:
+    """
+    Resolve the processor for a request, falling back to the default session
+    """
+    try:
+        if session_id is None:
+            return await run_session_call(sessions.get, DEFAULT_SESSION_ID, create=True)
+        return await run_session_call(sessions.get, session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown session: {session_id}")
+    except SessionLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+def pacing_hint() -> Dict:
+    """
+    How often and at what quality clients should send their next frame
+
+    The interval is each session's fair share of the workers at the current
+    per-frame latency, stretched by up to 2x as the analysis queue fills.
+    Under heavy load clients are also asked for smaller, lower quality JPEGs.
+    """
+    frame_seconds = executor.frame_seconds or 0.0
+    fair_share_ms = frame_seconds * 1000 * max(sessions.live_sessions, 1) / executor.max_workers
+    load = executor.load
+    interval = max(MIN_FRAME_INTERVAL_MS, fair_share_ms) * (1 + load)
+    reduced = load >= REDUCED_QUALITY_LOAD
+    return {
+        "next_interval_ms": int(min(interval, MAX_FRAME_INTERVAL_MS)),
+        "jpeg_quality": 0.6 if reduced else 0.8,
+        "max_width": 640 if reduced else None
+    }
+
+def queue_frame_save(processor: SimpleVideoProcessor, image_data: bytes, result: Dict) -> Dict:
+    """
+    Hand the frame as sent by the client to the background writer
+
+    saved_frame is the path the frame will be written to, or None when the
+    writer dropped it because its queue or disk quota is full. Frames of a
+    session closed while they were analyzed are not saved.
+    """
+    if 'timestamp' in result and not processor.closed:
+        result['saved_frame'] = frame_writer.submit(processor.session_id, image_data)
+    return result
+
+def decode_base64_frames(processor: SimpleVideoProcessor, frames: List[str]) -> List[bytes]:
+    """
+    Encoded bytes of base64 frames, empty for frames that are not valid base64
+
+    analyze_encoded_frame reports empty bytes as a frame that could not be decoded.
+    """
+    decoded = []
+    for frame in frames:
+        try:
+            decoded.append(processor.base64_to_bytes(frame))
+        except Exception:
+            decoded.append(b"")
+    return decoded
+
+def local_isoformat(value: Optional[datetime]) -> Optional[str]:
+    """
+    ISO timestamp in server local time without offset, as analyses record them
+    """
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat()
+
+def check_batch_size(count: int):
+    """
+    Reject empty batches and batches over MAX_BATCH_FRAMES before their frames are read
+    """
+    if not count:
+        raise HTTPException(status_code=400, detail="Batch contains no frames")
+    if count > MAX_BATCH_FRAMES:
+        raise HTTPException(status_code=413,
+                            detail=f"Batch of {count} frames exceeds the limit of {MAX_BATCH_FRAMES}")
+
+@app.post("/api/sessions")
+async def create_session(request: Optional[SessionRequest] = None):
+    """
+    Start a new analysis session
+    """
+    try:
+        session_id = await run_session_call(sessions.create, request.session_id if request else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SessionLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"session_id": session_id}
+
+@app.delete("/api/sessions/{session_id}")
+async def close_session(session_id: str):
+    """
+    Close a session and release its analysis data
+    """
+    if not await run_session_call(sessions.close, session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown session: {session_id}")
+    return {"message": "Session closed", "session_id": session_id}
+
+@app.post("/api/analyze-frame", response_model=FrameAnalysis)
 async def analyze_frame(frame_data: FrameData):
     """
     Analyze a single frame from the user video
     """
+    session_id = frame_data.session_id or DEFAULT_SESSION_ID
+    processor = await get_session_processor(frame_data.session_id)
+    method, frame = "analyze_base64_frame", frame_data.frame_data
+    if frame_data.save_frame:
+        # Decoded once, off the loop, for both the analysis and the saved file
+        method = "analyze_encoded_frame"
+        frame = (await asyncio.to_thread(decode_base64_frames, processor, [frame]))[0]
+    try:
+        result = await executor.analyze(session_id, processor, method, frame)
+        if frame_data.save_frame:
+            queue_frame_save(processor, frame, result)
+        result["pacing"] = pacing_hint()
+        return AnalysisJSONResponse(result)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def read_frame_bytes(request: Request) -> bytes:
+    """
+    Read an encoded frame from a raw image body or a multipart upload
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("frame")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Multipart upload must contain a 'frame' file")
+        return await upload.read()
+
+    if content_type and not content_type.startswith(("image/", "application/octet-stream")):
+        raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type}")
+    return await request.body()
+
+@app.post("/api/analyze-frame/binary", response_model=FrameAnalysis)
+async def analyze_frame_binary(request: Request, session_id: Optional[str] = None,
+                               save_frame: bool = False):
+    """
+    Analyze a single JPEG/PNG frame sent as raw bytes or multipart upload
+    """
+    processor = await get_session_processor(session_id)
+    image_data = await read_frame_bytes(request)
+    if not image_data:
+        raise HTTPException(status_code=400, detail="Empty frame")
+
+    session_id = session_id or DEFAULT_SESSION_ID
+    try:
+        result = await executor.analyze(session_id, processor, "analyze_encoded_frame", image_data)
+        if save_frame:
+            queue_frame_save(processor, image_data, result)
+        result["pacing"] = pacing_hint()
+        return AnalysisJSONResponse(result)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def analyze_batch_frames(processor: SimpleVideoProcessor, method: str, frames: List[tuple],
+                               saved_frames: Optional[Dict[int, bytes]] = None,
+                               timestamps: Optional[List[Optional[str]]] = None):
+    """
+    Run a batch of frames through the executor for a session processor
+
+    saved_frames maps batch indices to the encoded bytes to save for them,
+    timestamps holds the capture time of each frame if the client sent it.
+    """
     try:
-        result = processor.process_frame_from_base64(
-            frame_data.frame_data, 
-            save_frame=frame_data.save_frame
-        )
-        return result
+        results = await executor.analyze_batch(processor, method, frames, timestamps)
+        for index, image_data in (saved_frames or {}).items():
+            queue_frame_save(processor, image_data, results[index])
+        return AnalysisJSONResponse({"frames_analyzed": len(results), "results": results})
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/analyze-batch", response_model=BatchAnalysis)
+async def analyze_batch(batch: BatchRequest):
+    """
+    Analyze many base64 frames in one request, results in input order
+    """
+    check_batch_size(len(batch.frames))
+    processor = await get_session_processor(batch.session_id)
+    method, frames = "analyze_base64_frame", [frame.frame_data for frame in batch.frames]
+    saved = [index for index, frame in enumerate(batch.frames) if frame.save_frame]
+    if saved:
+        # Decoded once, off the loop, for both the analysis and the saved files
+        method = "analyze_encoded_frame"
+        frames = await asyncio.to_thread(decode_base64_frames, processor, frames)
+    saved_frames = {index: frames[index] for index in saved}
+    timestamps = [local_isoformat(frame.timestamp) for frame in batch.frames]
+    return await analyze_batch_frames(processor, method, [(frame,) for frame in frames],
+                                      saved_frames, timestamps)
+
+@app.post("/api/analyze-batch/binary", response_model=BatchAnalysis)
+async def analyze_batch_binary(request: Request, session_id: Optional[str] = None):
+    """
+    Analyze many JPEG/PNG frames sent as multipart 'frames' files, results in input order
+    """
+    form = await request.form()
+    uploads = [upload for upload in form.getlist("frames") if not isinstance(upload, str)]
+    check_batch_size(len(uploads))
+    processor = await get_session_processor(session_id)
+    frames = [(await upload.read(),) for upload in uploads]
+    return await analyze_batch_frames(processor, "analyze_encoded_frame", frames)
+
+def prune_video_jobs():
+    """
+    Drop finished video jobs past VIDEO_JOB_TTL and the oldest beyond MAX_FINISHED_VIDEO_JOBS
+    """
+    finished = sorted((job for job in video_jobs.values() if job.finished_at is not None),
+                      key=lambda job: job.finished_at)
+    cutoff = time.monotonic() - VIDEO_JOB_TTL
+    excess = len(finished) - MAX_FINISHED_VIDEO_JOBS
+    for index, job in enumerate(finished):
+        if index < excess or job.finished_at < cutoff:
+            del video_jobs[job.job_id]
+
+@app.post("/api/video-jobs")
+async def create_video_job(request: Request, sample_fps: float = 2.0):
+    """
+    Upload a recorded rehearsal (multipart 'video' file) and analyze it in the background
+
+    The upload is deleted once its analysis has finished.
+    """
+    prune_video_jobs()
+    if sum(job.running for job in video_jobs.values()) >= MAX_VIDEO_JOBS:
+        raise HTTPException(status_code=503, detail="Too many video jobs running",
+                            headers={"Retry-After": "30"})
+
+    form = await request.form()
+    upload = form.get("video")
+    if upload is None or isinstance(upload, str):
+        raise HTTPException(status_code=400, detail="Multipart upload must contain a 'video' file")
+
+    # Copy the upload to disk in chunks so long recordings never sit in memory
+    os.makedirs(VIDEO_UPLOAD_DIR, exist_ok=True)
+    extension = os.path.splitext(upload.filename or "")[1] or ".mp4"
+    path = os.path.join(VIDEO_UPLOAD_DIR, f"{int(time.time())}_{os.urandom(4).hex()}{extension}")
+    with open(path, "wb") as f:
+        while chunk := await upload.read(1024 * 1024):
+            f.write(chunk)
+
+    job = VideoAnalysisJob(path, sample_fps=sample_fps, workers=VIDEO_JOB_WORKERS,
+                           processor_factory=processor_factory, delete_video=True)
+    video_jobs[job.job_id] = job
+    job.start()
+    return job.to_dict()
+
+@app.get("/api/video-jobs/{job_id}")
+async def get_video_job(job_id: str):
+    """
+    Get progress and results of a recorded video job
+    """
+    prune_video_jobs()
+    job = video_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown video job: {job_id}")
+    return job.to_dict()
+
+@app.websocket("/api/sessions/{session_id}/stream")
+async def stream_frames(websocket: WebSocket, session_id: str, save_every: int = 0,
+                        compact: bool = False):
+    """
+    Analyze a continuous stream of binary JPEG frames for a session
+
+    Only the newest frame waiting for analysis is kept; frames arriving while
+    the analyzer is busy replace it and are counted as dropped. A frame the
+    executor has no room for is answered with a 'dropped' message carrying
+    a pacing hint, so the client can slow down at once. With compact
+    set, messages carry only the smoothed gaze state and gaze events instead
+    of the full frame analysis.
+    """
+    await websocket.accept()
+    try:
+        processor = await run_session_call(sessions.get, session_id)
+    except KeyError:
+        await websocket.close(code=1008, reason=f"Unknown session: {session_id}")
+        return
+
+    pending = {'frame': None}
+    frame_ready = asyncio.Event()
+    stats = {'received': 0, 'analyzed': 0, 'dropped': 0}
+
+    async def analyze_frames():
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            (frame_number, image_data), pending['frame'] = pending['frame'], None
+
+            save_frame = save_every > 0 and stats['analyzed'] % save_every == 0
+            try:
+                result = await executor.analyze(
+                    session_id, processor, "analyze_encoded_frame", image_data
+                )
+                if save_frame:
+                    queue_frame_save(processor, image_data, result)
+            except ExecutorSaturatedError:
+                stats['dropped'] += 1
+                metrics.dropped.inc(reason='saturated')
+                # Lets the client back off now instead of waiting for a result
+                await websocket.send_text(dumps_line({
+                    "type": "dropped",
+                    "frame": frame_number,
+                    "dropped": True,
+                    "dropped_frames": stats['dropped'],
+                    "pacing": pacing_hint()
+                }))
+                continue
+            except Exception as e:
+                result = {"error": str(e)}
+
+            stats['analyzed'] += 1
+            message = {
+                "type": "analysis",
+                "frame": frame_number,
+                "dropped_frames": stats['dropped'],
+                "pacing": pacing_hint()
+            }
+            if compact and "error" not in result:
+                message["type"] = "gaze"
+                message["gaze_state"] = result.get("gaze_state")
+                message["gaze_events"] = result.get("gaze_events", [])
+            else:
+                message["result"] = result
+            await websocket.send_text(dumps_line(message))
+
+    analyzer = asyncio.create_task(analyze_frames())
+    try:
+        while not analyzer.done():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            image_data = message.get("bytes")
+            if not image_data:
+                continue
+            # The registry sees no other request of a streaming session
+            if not sessions.touch(session_id):
+                await websocket.close(code=1008, reason=f"Session closed: {session_id}")
+                break
+            stats['received'] += 1
+            if pending['frame'] is not None:
+                stats['dropped'] += 1
+                metrics.dropped.inc(reason='superseded')
+            pending['frame'] = (stats['received'], image_data)
+            frame_ready.set()
+    finally:
+        analyzer.cancel()
+
+def require_analysis_store() -> AnalysisStore:
+    if analysis_store is None:
+        raise HTTPException(status_code=404, detail="Analysis store is disabled")
+    return analysis_store
+
+def posix_time(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() if value is not None else None
+
+@app.get("/api/analysis/frames")
+async def query_analysis_frames(session_id: Optional[str] = None, start: Optional[datetime] = None,
+                                end: Optional[datetime] = None, gaze_direction: Optional[str] = None,
+                                emotion: Optional[str] = None, limit: int = Query(1000, ge=1)):
+    """
+    Stored frames in a time range, optionally of one session, gaze direction or emotion
+
+    At most MAX_QUERY_ROWS frames are returned, whatever the limit.
+    """
+    store = require_analysis_store()
+    frames = await asyncio.to_thread(store.query_frames, session_id, posix_time(start), posix_time(end),
+                                     gaze_direction, emotion, min(limit, MAX_QUERY_ROWS))
+    return {"count": len(frames), "frames": frames}
+
+@app.get("/api/analysis/aggregate")
+async def query_analysis_aggregate(session_id: Optional[str] = None, start: Optional[datetime] = None,
+                                   end: Optional[datetime] = None, bucket_seconds: Optional[float] = None):
+    """
+    Frame counts, looking-at-screen percentage and brightness over a time range
+
+    With bucket_seconds the range is split into buckets of that length.
+    """
+    store = require_analysis_store()
+    if bucket_seconds is not None and bucket_seconds <= 0:
+        raise HTTPException(status_code=422, detail="bucket_seconds must be positive")
+    buckets = await asyncio.to_thread(store.aggregate, session_id, posix_time(start), posix_time(end),
+                                      bucket_seconds)
+    return {"buckets": buckets}
+
+@app.get("/api/analysis/sessions")
+async def query_analysis_sessions(min_looking_away_percentage: Optional[float] = None,
+                                  start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                  limit: int = Query(100, ge=1)):
+    """
+    Stored sessions with their totals, e.g. those looking away for at least 30% of frames
+
+    At most MAX_QUERY_ROWS sessions are returned, whatever the limit.
+    """
+    store = require_analysis_store()
+    found = await asyncio.to_thread(store.query_sessions, min_looking_away_percentage,
+                                    posix_time(start), posix_time(end), min(limit, MAX_QUERY_ROWS))
+    return {"count": len(found), "sessions": found}
+
 @app.get("/api/analysis-summary")
-async def get_analysis_summary():
+async def get_analysis_summary(session_id: Optional[str] = None):
     """
-    Get summary of all frame analyses
+    Get summary of all frame analyses of a session
     """
+    processor = await get_session_processor(session_id)
     try:
-        summary = processor.get_analysis_summary()
+        summary = await run_session_call(processor.get_analysis_summary)
         return summary
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/save-analysis")
-async def save_analysis():
+async def save_analysis(session_id: Optional[str] = None):
     """
-    Save all analysis data to file
+    Finalise the session log so far and return its path
+
+    The log is written as frames are analysed, so saving only closes the
+    current file; later frames go to a new one. Without a session log the
+    retained history is dumped to a JSON file instead.
     """
+    processor = await get_session_processor(session_id)
     try:
-        filepath = processor.save_analysis_to_file()
+        if processor.log is not None:
+            filepath = await run_session_call(processor.finalize_log)
+            if filepath is None:
+                return {"message": "No new analysis data to save", "filepath": None}
+            return {"message": "Analysis saved", "filepath": filepath}
+
+        filename = f"analysis_{session_id or DEFAULT_SESSION_ID}_{int(time.time())}.json"
+        filepath = await run_session_call(processor.save_analysis_to_file, filename)
         return {"message": "Analysis saved", "filepath": filepath}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -68,11 +787,54 @@ async def get_status():
     """
     Get API status
     """
+    await run_session_call(sessions.evict_idle)
+    active = await run_session_call(len, sessions)
+    frames = metrics.frames.value()
     return {
-        "status": "running",
-        "frames_analyzed": len(processor.emotion_history),
-        "processor_ready": True
+        "status": "running" if readiness['ready'] else "warming_up",
+        "frames_analyzed": sum(p.history.total_frames for p in sessions.processors()),
+        "unchanged_frame_rate": round(metrics.unchanged.value() / frames, 3) if frames else 0.0,
+        "active_sessions": active,
+        "session_store": SESSION_STORE,
+        "server_workers": SERVER_WORKERS,
+        "worker_pid": os.getpid(),
+        "max_sessions": MAX_SESSIONS,
+        "face_detector": FACE_DETECTOR,
+        "emotion_model": EMOTION_MODEL,
+        "emotion_batcher": emotion_batcher_status(),
+        "executor": executor.status(),
+        "pacing": pacing_hint(),
+        "frame_writer": frame_writer.status(),
+        "analysis_store": analysis_store.status() if analysis_store is not None else None,
+        "processor_ready": readiness['ready'],
+        "warmup": readiness
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Analysis metrics in the Prometheus text exposition format
+    """
+    queue_depth.set(executor.pending)
+    queue_limit.set(executor.max_pending)
+    frames_per_second.set(round(metrics.frame_rate.rate(), 3))
+    active_sessions.set(await run_session_call(len, sessions))
+    writer_status = frame_writer.status()
+    writer_queue.set(writer_status['frames_queued'])
+    writer_dropped.set(writer_status['frames_dropped'])
+    return PlainTextResponse(metrics.registry.render(),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/ready")
+async def get_ready():
+    """
+    Readiness probe: 200 once the analysis workers are warm, 503 before
+    """
+    if not readiness['ready']:
+        raise HTTPException(status_code=503, detail=readiness['error'] or "Warming up",
+                            headers={"Retry-After": "1"})
+    return {"ready": True, "warmup_seconds": readiness['warmup_seconds']}
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8003) 
\ No newline at end of file
+    # Several server workers are started before the app state is built, above
+    uvicorn.run(app, host="0.0.0.0", port=8003)
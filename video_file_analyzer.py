@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from analysis_history import AnalysisHistory
+from frame_executor import analyze_independent, init_worker
+from frame_ring import SharedFrameRing
+from metrics import STAGE_OUTCOMES_KEY, STAGE_TIMINGS_KEY
+from simple_video_processor import SimpleVideoProcessor
+
+
+def iter_video_frames(path: str, sample_fps: float = 2.0) -> Iterator[Tuple[int, float, np.ndarray]]:
+    """
+    Read a video file lazily, yielding (frame_index, seconds, frame) at sample_fps
+
+    Skipped frames are only grabbed, not decoded into images, and no frame is
+    kept after it has been yielded.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {path}")
+
+    try:
+        video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(video_fps / sample_fps, 1.0) if sample_fps > 0 else 1.0
+        next_sample = 0.0
+        frame_index = 0
+
+        while cap.grab():
+            if frame_index >= next_sample:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                yield frame_index, frame_index / video_fps, frame
+                next_sample += step
+            frame_index += 1
+    finally:
+        cap.release()
+
+
+def analyze_video_file(path: str, output_path: Optional[str] = None, sample_fps: float = 2.0,
+                       workers: Optional[int] = None,
+                       processor_factory: Callable[..., SimpleVideoProcessor] = SimpleVideoProcessor,
+                       progress: Optional[Callable[[int, float], None]] = None) -> Dict:
+    """
+    Analyze a recorded video and write one JSON line per sampled frame
+
+    Decoding runs in this process while analysis runs on a pool of worker
+    processes; at most a few frames per worker are in flight, so memory use
+    does not depend on the video length. Decoded frames reach the workers
+    through a shared memory ring instead of being pickled. Results are
+    written in frame order.
+
+    Args:
+        path: Video file to analyze
+        output_path: JSONL file for per-frame results, defaults to the output folder
+        sample_fps: Frames analyzed per second of video
+        workers: Worker processes, defaults to the number of CPU cores
+        processor_factory: Builds the processors used in the workers
+        progress: Called with (frames_analyzed, video_seconds) after each frame
+    """
+    if output_path is None:
+        output_dir = "video_analysis_output"
+        os.makedirs(output_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(path))[0]
+        output_path = os.path.join(output_dir, f"{name}_analysis_{int(time.time())}.jsonl")
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    history = AnalysisHistory()
+    start_time = time.time()
+    ring: Optional[SharedFrameRing] = None
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(processor_factory,)) as pool, \
+                open(output_path, 'w') as output:
+            in_flight = deque()
+
+            def write_next():
+                frame_index, seconds, future = in_flight.popleft()
+                analysis = future.result()
+                analysis.pop(STAGE_TIMINGS_KEY, None)
+                analysis.pop(STAGE_OUTCOMES_KEY, None)
+                analysis['frame_index'] = frame_index
+                analysis['video_time'] = round(seconds, 3)
+                history.append(analysis)
+                output.write(json.dumps(analysis) + '\n')
+                if progress:
+                    progress(history.total_frames, seconds)
+
+            for frame_index, seconds, frame in iter_video_frames(path, sample_fps):
+                if ring is None:
+                    # Sized to the first frame, one slot per frame in flight
+                    ring = SharedFrameRing(slots=max_in_flight, slot_bytes=frame.nbytes)
+                ref = ring.share(frame)
+                future = pool.submit(analyze_independent, "analyze_decoded_frame", ref)
+                future.add_done_callback(lambda _, ref=ref: ring.release(ref))
+                in_flight.append((frame_index, seconds, future))
+                if len(in_flight) >= max_in_flight:
+                    write_next()
+
+            while in_flight:
+                write_next()
+    finally:
+        if ring is not None:
+            ring.close()
+
+    return {
+        'video': path,
+        'output': output_path,
+        'sample_fps': sample_fps,
+        'processing_seconds': round(time.time() - start_time, 3),
+        'summary': history.summary()
+    }
+
+
+class VideoAnalysisJob:
+    def __init__(self, path: str, sample_fps: float = 2.0, workers: Optional[int] = None,
+                 processor_factory: Callable[..., SimpleVideoProcessor] = SimpleVideoProcessor,
+                 delete_video: bool = False):
+        """
+        Background analysis of an uploaded video file
+
+        Args:
+            path: Video file to analyze
+            sample_fps: Frames analyzed per second of video
+            workers: Worker processes, defaults to the number of CPU cores
+            processor_factory: Builds the processors used in the workers
+            delete_video: Delete the video file once the job has finished
+        """
+        self.job_id = uuid.uuid4().hex
+        self.path = path
+        self.sample_fps = sample_fps
+        self.workers = workers
+        self.processor_factory = processor_factory
+        self.delete_video = delete_video
+
+        self.status = 'queued'
+        self.frames_analyzed = 0
+        self.video_seconds = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        # time.monotonic() when the job completed or failed
+        self.finished_at: Optional[float] = None
+        self._thread = threading.Thread(target=self._run, name=f"video-job-{self.job_id}", daemon=True)
+
+    @property
+    def running(self) -> bool:
+        return self.status in ('queued', 'running')
+
+    def start(self):
+        self._thread.start()
+
+    def _progress(self, frames_analyzed: int, video_seconds: float):
+        self.frames_analyzed = frames_analyzed
+        self.video_seconds = video_seconds
+
+    def _run(self):
+        self.status = 'running'
+        try:
+            self.result = analyze_video_file(self.path, sample_fps=self.sample_fps,
+                                             workers=self.workers,
+                                             processor_factory=self.processor_factory,
+                                             progress=self._progress)
+            self.status = 'completed'
+        except Exception as e:
+            self.error = str(e)
+            self.status = 'failed'
+        finally:
+            if self.delete_video:
+                try:
+                    os.remove(self.path)
+                except OSError as e:
+                    print(f"Error deleting analyzed video: {e}")
+            self.finished_at = time.monotonic()
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'video': os.path.basename(self.path),
+            'frames_analyzed': self.frames_analyzed,
+            'video_seconds': round(self.video_seconds, 3),
+            'created_at': self.created_at,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze a recorded rehearsal video")
+    parser.add_argument('video', help='Video file to analyze')
+    parser.add_argument('--fps', type=float, default=2.0, help='Frames analyzed per second of video')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU cores)')
+    parser.add_argument('--output', default=None, help='JSONL output file')
+    args = parser.parse_args()
+
+    def print_progress(frames_analyzed: int, video_seconds: float):
+        if frames_analyzed % 50 == 0:
+            print(f"{frames_analyzed} frames analyzed ({video_seconds:.0f}s of video)")
+
+    result = analyze_video_file(args.video, args.output, sample_fps=args.fps,
+                                workers=args.workers, progress=print_progress)
+    print(json.dumps(result, indent=2))
@@ -1,16 +1,37 @@
 import cv2
 import numpy as np
 import base64
-import requests
+import importlib
 import json
 import time
 import threading
 from datetime import datetime
 import os
 from typing import Dict, List, Optional
-import mediapipe as mp
-from deepface import DeepFace
 import tempfile
+from face_detectors import FaceDetector, create_face_detector
+from emotion_stage import EmotionStage
+
+# mediapipe, deepface and requests take seconds to import, so they are only
+# loaded when a method first needs them (or by warm_up)
+_modules = {}
+_modules_lock = threading.Lock()
+
+def _lazy_import(name: str):
+    """
+    Import a heavy module on first use and cache it
+    """
+    module = _modules.get(name)
+    if module is None:
+        with _modules_lock:
+            module = _modules.get(name)
+            if module is None:
+                module = importlib.import_module(name)
+                _modules[name] = module
+    return module
+
+def _deepface():
+    return _lazy_import('deepface').DeepFace
 
 class VideoProcessor:
     def __init__(self, api_key: str = None):
@@ -27,17 +48,43 @@ class VideoProcessor:
         self.max_frames = 30  # Process every 30 frames (1 second at 30fps)
         self.frame_count = 0
         
-        # Initialize MediaPipe for face detection
-        self.mp_face_detection = mp.solutions.face_detection
-        self.mp_drawing = mp.solutions.drawing_utils
-        self.face_detection = self.mp_face_detection.FaceDetection(
-            model_selection=0, min_detection_confidence=0.5
-        )
+        # MediaPipe face detection is created on first use
+        self._face_detector = None
+        
+        # DeepFace runs on the primary face only when it changed noticeably
+        self.emotion_stage = EmotionStage(max_age=5.0)
         
         # Create output directory
         self.output_dir = "video_analysis_output"
         os.makedirs(self.output_dir, exist_ok=True)
     
+    @property
+    def face_detector(self) -> FaceDetector:
+        """
+        MediaPipe face detector, imported and created on first use
+        """
+        if self._face_detector is None:
+            self._face_detector = create_face_detector('mediapipe')
+        return self._face_detector
+    
+    def warm_up(self) -> Dict:
+        """
+        Load the face detector and emotion model by analyzing a blank frame
+        
+        Without this the first real frame pays for the imports and for
+        DeepFace loading its model weights.
+        """
+        start_time = time.time()
+        frame = np.full((480, 640, 3), 128, dtype=np.uint8)
+        try:
+            self.detect_faces(frame)
+            emotions = self.analyze_emotions(frame)
+            ready = 'error' not in emotions
+        except Exception as e:
+            print(f"Error warming up video processor: {e}")
+            ready = False
+        return {'ready': ready, 'seconds': round(time.time() - start_time, 3)}
+    
     def capture_frame_from_webcam(self) -> Optional[np.ndarray]:
         """
         Capture a single frame from the default webcam
@@ -64,13 +111,27 @@ class VideoProcessor:
     def analyze_emotions(self, frame: np.ndarray) -> Dict:
         """
         Analyze emotions in a video frame using DeepFace
+        
+        When a face is found only its crop is classified, and the previous
+        result is reused while the face looks the same. Frames without a
+        detected face are analysed whole.
         """
+        faces = self.detect_faces(frame)
+        if faces:
+            primary_face = max(faces, key=lambda f: f['width'] * f['height'])
+            emotion_result = self.emotion_stage.analyze(frame, primary_face)
+            if emotion_result is not None:
+                emotion_result['timestamp'] = datetime.now().isoformat()
+                return emotion_result
+        else:
+            self.emotion_stage.reset()
+        
         try:
             # Convert BGR to RGB for DeepFace
             rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             
             # Analyze emotions
-            result = DeepFace.analyze(
+            result = _deepface().analyze(
                 rgb_frame, 
                 actions=['emotion'], 
                 enforce_detection=False,
@@ -107,26 +168,7 @@ class VideoProcessor:
         Detect faces in the frame using MediaPipe
         """
         try:
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = self.face_detection.process(rgb_frame)
-            
-            faces = []
-            if results.detections:
-                for detection in results.detections:
-                    bbox = detection.location_data.relative_bounding_box
-                    h, w, _ = frame.shape
-                    
-                    face_info = {
-                        'x': int(bbox.xmin * w),
-                        'y': int(bbox.ymin * h),
-                        'width': int(bbox.width * w),
-                        'height': int(bbox.height * h),
-                        'confidence': detection.score[0]
-                    }
-                    faces.append(face_info)
-            
-            return faces
-            
+            return self.face_detector.detect(frame)
         except Exception as e:
             print(f"Error detecting faces: {e}")
             return []
@@ -191,7 +233,7 @@ class VideoProcessor:
                 "max_tokens": 500
             }
             
-            response = requests.post(
+            response = _lazy_import('requests').post(
                 "https://api.openai.com/v1/chat/completions",
                 headers=headers,
                 json=data
@@ -243,7 +285,7 @@ class VideoProcessor:
                     ]
                 }
                 
-                response = requests.post(url, json=data)
+                response = _lazy_import('requests').post(url, json=data)
                 
                 if response.status_code == 200:
                     result = response.json()